@@ -0,0 +1,25 @@
+import os
+import tempfile
+from typing import Union
+
+
+def write_atomic(path: str, content: Union[str, bytes]):
+    '''
+    Replace the file at path with content. Readers see either the old or
+    the new file, never a partly written one, and a failed write leaves
+    no temporary file behind.
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        if isinstance(content, bytes):
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,145 @@
+from circuit_breaker import default_cooldown
+from concurrent.futures import ProcessPoolExecutor
+from dividend_info import DividendInfo
+import logging
+import multiprocessing
+import os
+import queue
+from typing import Callable, Dict, List
+
+from metrics import Metrics, metrics
+
+log = logging.getLogger(os.path.basename(__file__))
+
+
+def shard(stocks: List[str], nr_worker: int) -> List[List[str]]:
+    # round robin, so slow and fast parts of the watch list are spread out
+    shards = [stocks[i::nr_worker] for i in range(nr_worker)]
+    return [s for s in shards if s]
+
+
+def run_worker(stocks: List[str], getter_names: List[str], options: dict, result_queue) -> Metrics:
+    '''
+    Entry point of a worker process. Every (stock_id, info) is put on
+    result_queue as soon as it is done, so a crash only loses the stocks
+    still running. Returns the metrics of the worker.
+    '''
+    import dividend_getter
+    from circuit_breaker import CircuitBreakerStore
+    from http_cache import HttpCache
+
+    logging.basicConfig(level=options.get('log_level', logging.ERROR),
+                        format='[%(levelname)7s] %(asctime)s %(processName)s %(name)s %(message)s')
+
+    cache_dir = options.get('cache_dir')
+    dividend_getter.DividendWebsite.cache = HttpCache(cache_dir) if cache_dir else None
+    dividend_getter.DividendWebsite.listing_snapshot_dir = options.get('listing_snapshot_dir')
+    dividend_getter.DividendWebsite.circuit_breakers = \
+        CircuitBreakerStore(options.get('circuit_state'), cooldown=options['circuit_cooldown'])
+    if options.get('request_timeout') is not None:
+        dividend_getter.set_request_timeout(options['request_timeout'])
+
+    metrics.reset()
+    dividend_getter.get_many_dividend_info(
+        stocks,
+        dividend_getter.get_dividend_getters(getter_names),
+        max_nr_record=options['max_nr_record'],
+        sleep_interval=options['sleep_interval'],
+        max_concurrency=options['max_concurrency'],
+        strategy=options['strategy'],
+        deadline=options.get('deadline'),
+        stock_timeout=options.get('stock_timeout'),
+        start_delay=options.get('start_delay', 0.0),
+        keep_results=False,
+        on_result=lambda stock_id, info: result_queue.put((stock_id, info)))
+    return metrics
+
+
+def get_many_dividend_info(stocks: List[str], getter_names: List[str], nr_worker: int,
+                           max_nr_record: int, sleep_interval: float, max_concurrency: int,
+                           strategy: str, cache_dir: str = None, circuit_state: str = None,
+                           circuit_cooldown: float = default_cooldown,
+                           on_result: Callable[[str, DividendInfo], None] = None,
+                           deadline: float = None, stock_timeout: float = None,
+                           request_timeout: float = None, keep_results: bool = True) \
+                          -> Dict[str, DividendInfo]:
+    '''
+    Split stocks over nr_worker processes. Every worker waits nr_worker
+    times sleep_interval between requests to the same host, and worker i
+    starts i times sleep_interval late, so the workers take turns and all
+    of them together stay within the rate of a single process.
+    on_result(stock_id, info) is called in this process for every stock as
+    soon as a worker is done with it. deadline, stock_timeout and
+    request_timeout are applied in every worker, and keep_results in this
+    process, see dividend_getter.async_get_many_dividend_info.
+    '''
+    import dividend_getter
+    options = {
+        'max_nr_record': max_nr_record,
+        'sleep_interval': sleep_interval * nr_worker,
+        'max_concurrency': max_concurrency,
+        'strategy': strategy,
+        'cache_dir': cache_dir,
+        'circuit_state': circuit_state,
+        'circuit_cooldown': circuit_cooldown,
+        # time.time() is the same clock in every process
+        'deadline': deadline,
+        'stock_timeout': stock_timeout,
+        'request_timeout': request_timeout,
+        'listing_snapshot_dir': dividend_getter.DividendWebsite.listing_snapshot_dir,
+        'log_level': logging.getLogger().getEffectiveLevel(),
+    }
+    if options['listing_snapshot_dir'] is not None:
+        # load listings once here, the workers map their snapshot
+        for getter in dividend_getter.get_dividend_getters(getter_names):
+            try:
+                getter.prefetch()
+            except Exception as err:
+                log.warning('Failed to prefetch listing of %s: %s' % (getter.name, err))
+
+    shards = shard(stocks, nr_worker)
+    log.info('Split %d stocks over %d workers' % (len(stocks), len(shards)))
+
+    results = {}
+    done = set()
+    # spawn, the parent may already run getter and browser threads
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as pool:
+        # a managed queue can be passed to pool workers, a plain one only to children
+        result_queue = manager.Queue()
+        futures = [pool.submit(run_worker, s, getter_names, dict(options, start_delay=i * sleep_interval),
+                               result_queue)
+                   for i, s in enumerate(shards)]
+        while True:
+            try:
+                stock_id, info = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                # a worker's results are all queued by the time it is done
+                if all(future.done() for future in futures):
+                    break
+                continue
+            metrics.record_result(stock_id, info.source)
+            done.add(stock_id)
+            if keep_results:
+                results[stock_id] = info
+            if on_result is not None:
+                on_result(stock_id, info)
+
+    for future in futures:
+        if future.exception() is not None:
+            log.error('A worker failed: %s' % future.exception())
+        else:
+            metrics.merge(future.result())
+    # stocks of a crashed worker that never finished
+    for stock_id in stocks:
+        if stock_id not in done:
+            info = dividend_getter.check_div_info(stock_id, None)
+            if keep_results:
+                results[stock_id] = info
+            if on_result is not None:
+                on_result(stock_id, info)
+
+    if not keep_results:
+        return {}
+    return {stock_id: results[stock_id] for stock_id in stocks}
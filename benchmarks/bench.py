@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+'''
+Offline benchmark of the getters and the batch pipeline, replaying the
+fixtures recorded by fixtures.py through stub_server.py:
+
+    benchmarks/fixtures.py synthesize       # or: record, needs network once
+    benchmarks/bench.py --sizes 10 100 1000 5000 --json bench.json
+
+Reports parse time per page, moneydj lookups per second, and batch wall
+time and peak memory for each watch list size.
+'''
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dividend_getter
+from fixtures import default_fixture_dir, list_fixtures, moneydj_key, read_fixture
+from html_parser import make_soup
+import listing_snapshot
+from stub_server import StubServer
+
+default_sizes = [10, 100, 1000, 5000]
+getter_classes = {
+    'goodinfo': dividend_getter.DividendGoodinfo,
+    'moneylink': dividend_getter.DividendMoneylink,
+    'moneydj': dividend_getter.DividendMoneydj,
+}
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def parse_page(getter: dividend_getter.DividendWebsite, key: str, page: str):
+    soup = make_soup(page, getter.get_parse_only())
+    if getter.name == 'goodinfo':
+        getter.parse_div_data(soup)
+        getter.parse_stockname(soup)
+    elif getter.name == 'moneylink':
+        getter.parse_div_data(key, soup)
+        getter.parse_stockname(soup, key)
+    else:
+        getter.parse_listing(soup)
+
+
+def bench_parse(fixture_dir: str, repeat: int) -> List[dict]:
+    results = []
+    for source, keys in list_fixtures(fixture_dir).items():
+        getter = getter_classes[source]()
+        for key in keys:
+            page = read_fixture(fixture_dir, source, key)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                parse_page(getter, key, page)
+            elapsed = (time.perf_counter() - start) / repeat
+
+            tracemalloc.start()
+            parse_page(getter, key, page)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({'source': source, 'page': key, 'kb': len(page) // 1024,
+                            'ms': elapsed * 1000, 'peak_mb': peak / 1024 / 1024})
+    return results
+
+
+def bench_lookups(fixture_dir: str, nr_lookup: int) -> dict:
+    getter = dividend_getter.DividendMoneydj()
+    getter.listing = getter.parse_listing(make_soup(read_fixture(fixture_dir, 'moneydj', moneydj_key),
+                                                    getter.get_parse_only()))
+    stocks = list(getter.listing)
+    if not stocks:
+        return {'lookups_per_sec': 0.0}
+    start = time.perf_counter()
+    for i in range(nr_lookup):
+        getter.get_dividend_info(stocks[i % len(stocks)])
+    elapsed = time.perf_counter() - start
+    return {'stocks': len(stocks), 'lookups_per_sec': nr_lookup / elapsed}
+
+
+def bench_snapshot(fixture_dir: str) -> dict:
+    ''' Parsing the moneydj table against mapping its snapshot, up to the first lookup '''
+    getter = dividend_getter.DividendMoneydj()
+    start = time.perf_counter()
+    listing = getter.parse_listing(make_soup(read_fixture(fixture_dir, 'moneydj', moneydj_key),
+                                             getter.get_parse_only()))
+    next(iter(listing.values()))
+    parse = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        path = listing_snapshot.get_snapshot_path(snapshot_dir, getter.name)
+        listing_snapshot.write_snapshot(path, listing)
+        start = time.perf_counter()
+        snapshot = listing_snapshot.open_snapshot(path, max_age=60)
+        snapshot[next(iter(snapshot))]
+        mapped = time.perf_counter() - start
+        size = os.path.getsize(path)
+    return {'parse_ms': parse * 1000, 'snapshot_ms': mapped * 1000, 'snapshot_kb': size // 1024}
+
+
+def bench_batch(server: StubServer, sizes: List[int], sources: List[str],
+                concurrency: int, strategy: str, sleep_interval: float,
+                trace_memory: bool = False) -> List[dict]:
+    results = []
+    for size in sizes:
+        stocks = ['%04d' % (1101 + i) for i in range(size)]
+        getters = [getter_classes[source]() for source in sources]
+        server.point_getters(getters)
+        nr_request = server.nr_request
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        div_info = dividend_getter.get_many_dividend_info(stocks, getters,
+                                                          sleep_interval=sleep_interval,
+                                                          max_concurrency=concurrency,
+                                                          strategy=strategy)
+        elapsed = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+
+        nr_error = sum(1 for info in div_info.values() if info.error is not None)
+        results.append({'stocks': size, 'wall_sec': elapsed, 'stocks_per_sec': size / elapsed,
+                        'peak_mb': peak, 'max_rss_mb': max_rss_mb(),
+                        'requests': server.nr_request - nr_request, 'errors': nr_error})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of dividend getters.')
+    parser.add_argument('-d', '--fixture-dir', default=default_fixture_dir,
+                        help='default value is %(default)s')
+    parser.add_argument('--sizes', nargs='+', type=int, default=default_sizes,
+                        help='Watch list sizes of the batch benchmark, default value is %(default)s')
+    parser.add_argument('--sources', nargs='+', default=['moneylink', 'moneydj'],
+                        choices=['moneydj', 'moneylink'],
+                        help='Getters of the batch benchmark, default value is %(default)s')
+    parser.add_argument('--strategy', default=dividend_getter.default_strategy,
+                        choices=dividend_getter.all_strategies)
+    parser.add_argument('-c', '--concurrency', type=int, default=dividend_getter.default_max_concurrency)
+    parser.add_argument('-i', '--sleep-interval', type=float, default=0,
+                        help='Per-host request interval, default value is %(default)s')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds the stub server waits before every answer')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests the stub server answers with 503')
+    parser.add_argument('--trace-memory', action='store_true', default=False,
+                        help='Report the peak python memory of each batch, which slows it down')
+    parser.add_argument('-n', '--repeat', type=int, default=3)
+    parser.add_argument('--json', type=argparse.FileType('w'), help='Also write the results here')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    if not list_fixtures(args.fixture_dir):
+        parser.error('no fixtures in %s, run fixtures.py record or synthesize first' % args.fixture_dir)
+
+    # measure the pipeline, not the cache or the breaker
+    dividend_getter.DividendWebsite.cache = None
+    dividend_getter.DividendWebsite.circuit_breakers = None
+    dividend_getter.DividendWebsite.listing_snapshot_dir = None
+
+    report = {}
+    report['parse'] = bench_parse(args.fixture_dir, args.repeat)
+    print('%-10s %-12s %8s %10s %10s' % ('source', 'page', 'KB', 'ms/page', 'peak MB'))
+    for r in report['parse']:
+        print('%-10s %-12s %8d %10.2f %10.2f' % (r['source'], r['page'], r['kb'], r['ms'], r['peak_mb']))
+
+    if moneydj_key in list_fixtures(args.fixture_dir).get('moneydj', []):
+        report['lookup'] = bench_lookups(args.fixture_dir, 100000)
+        print('\nmoneydj: %.0f lookups/sec over %d stocks' %
+              (report['lookup']['lookups_per_sec'], report['lookup'].get('stocks', 0)))
+        report['snapshot'] = bench_snapshot(args.fixture_dir)
+        print('moneydj: first lookup %.2f ms after parsing, %.2f ms from a %d KB snapshot' %
+              (report['snapshot']['parse_ms'], report['snapshot']['snapshot_ms'],
+               report['snapshot']['snapshot_kb']))
+
+    server = StubServer(args.fixture_dir, args.latency, args.error_rate).start()
+    try:
+        report['batch'] = bench_batch(server, args.sizes, args.sources, args.concurrency,
+                                      args.strategy, args.sleep_interval, args.trace_memory)
+    finally:
+        server.stop()
+    print('\n%8s %10s %10s %10s %10s %9s %7s' %
+          ('stocks', 'wall sec', 'stocks/s', 'peak MB', 'rss MB', 'requests', 'errors'))
+    for r in report['batch']:
+        peak = '-' if r['peak_mb'] is None else '%.2f' % r['peak_mb']
+        print('%8d %10.2f %10.1f %10s %10.1f %9d %7d' %
+              (r['stocks'], r['wall_sec'], r['stocks_per_sec'], peak,
+               r['max_rss_mb'], r['requests'], r['errors']))
+
+    if args.json is not None:
+        json.dump(report, args.json, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+'''
+Compare date_parser.parse_date against the strptime calls it replaced,
+on rows shaped like a bulk table: a few thousand dates, most of them
+repeated since a schedule only spans a few weeks.
+
+    benchmarks/bench_dates.py -n 100000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from date_parser import parse_date
+
+
+def old_roc(text: str) -> date:
+    parts = text.split('/')
+    parts[0] = str(int(parts[0]) + 1911)
+    return datetime.strptime('/'.join(parts), '%Y/%m/%d').date()
+
+
+def old_goodinfo(text: str) -> date:
+    return datetime.strptime(text[0:9], '\'%y/%m/%d').date()
+
+
+def old_ad(text: str) -> date:
+    return datetime.strptime(text, '%Y/%m/%d').date()
+
+
+formats = {
+    'ad': ('%Y/%m/%d', old_ad),
+    'roc': (None, old_roc),
+    'goodinfo': ('\'%y/%m/%d', old_goodinfo),
+}
+
+
+def make_dates(kind: str, n: int, nr_day: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    start = date.today()
+    texts = []
+    for _ in range(n):
+        d = start + timedelta(days=rnd.randrange(nr_day))
+        if kind == 'roc':
+            texts.append('%d/%02d/%02d' % (d.year - 1911, d.month, d.day))
+        else:
+            texts.append(d.strftime(formats[kind][0]))
+    return texts
+
+
+def measure(parse, texts: list) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        parse(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark date parsing.')
+    parser.add_argument('-n', '--number', type=int, default=100000, help='Dates per format')
+    parser.add_argument('-d', '--days', type=int, default=60,
+                        help='Distinct days the dates are drawn from, default value is %(default)s')
+    args = parser.parse_args()
+
+    print('%-10s %12s %12s %12s %8s' % ('format', 'strptime us', 'uncached us', 'cached us', 'speedup'))
+    for kind, (_, old_parse) in formats.items():
+        texts = make_dates(kind, args.number, args.days)
+        assert all(parse_date(t) == old_parse(t) for t in texts[:1000])
+
+        old = measure(old_parse, texts)
+        uncached = measure(parse_date.__wrapped__, texts)
+        parse_date.cache_clear()
+        cached = measure(parse_date, texts)
+        print('%-10s %12.2f %12.2f %12.2f %7.1fx' %
+              (kind, old / len(texts) * 1e6, uncached / len(texts) * 1e6,
+               cached / len(texts) * 1e6, old / cached))
+
+
+if __name__ == '__main__':
+    main()
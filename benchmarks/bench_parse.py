@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+'''
+Compare parsing a saved page with the full html.parser tree against the
+targeted parse each getter uses (lxml when installed, restricted by the
+getter's parse_only strainer).
+
+    benchmarks/bench_parse.py moneydj path/to/ZEB.djhtm
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+import dividend_getter
+from html_parser import default_features, make_soup
+
+
+
+def measure(parse, markup: str, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(markup)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    soup = parse(markup)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del soup
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark page parsing.')
+    parser.add_argument('getter', choices=list(dividend_getter.all_dividend_getters))
+    parser.add_argument('fixtures', nargs='+', help='Saved html pages')
+    parser.add_argument('-n', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    parse_only = dividend_getter.all_dividend_getters[args.getter].get_parse_only()
+    candidates = [
+        ('html.parser full tree', lambda m: BeautifulSoup(m, 'html.parser')),
+        ('%s full tree' % default_features, lambda m: make_soup(m)),
+        ('%s parse_only' % default_features, lambda m: make_soup(m, parse_only)),
+    ]
+
+    for path in args.fixtures:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            markup = f.read()
+        print('%s (%d KB)' % (path, len(markup) // 1024))
+        for name, parse in candidates:
+            elapsed, peak = measure(parse, markup, args.repeat)
+            print('  %-24s %8.1f ms %8.1f MB peak' % (name, elapsed * 1000, peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
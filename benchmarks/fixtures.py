@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+'''
+Record real pages of every source once, so benchmarks can replay them
+without network:
+
+    benchmarks/fixtures.py record -s 2330 0050 00878 -d benchmarks/fixtures
+
+Layout of a fixture directory:
+
+    <source>/<stock_id>.html    one page per stock (goodinfo, moneylink)
+    moneydj/ZEB.html            the market-wide table of moneydj
+
+synthesize() writes pages shaped like the real ones, for when no
+recorded fixtures are at hand.
+'''
+import argparse
+import logging
+import os
+import random
+import sys
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+all_sources = ('goodinfo', 'moneylink', 'moneydj')
+moneydj_key = 'ZEB'
+
+
+def fixture_path(fixture_dir: str, source: str, key: str) -> str:
+    return os.path.join(fixture_dir, source, '%s.html' % key)
+
+
+def list_fixtures(fixture_dir: str) -> Dict[str, List[str]]:
+    ''' source -> keys of the recorded pages '''
+    fixtures = {}
+    for source in all_sources:
+        source_dir = os.path.join(fixture_dir, source)
+        if not os.path.isdir(source_dir):
+            continue
+        fixtures[source] = sorted(name[:-len('.html')] for name in os.listdir(source_dir)
+                                  if name.endswith('.html'))
+    return fixtures
+
+
+def read_fixture(fixture_dir: str, source: str, key: str) -> str:
+    with open(fixture_path(fixture_dir, source, key), encoding='utf-8') as f:
+        return f.read()
+
+
+def write_fixture(fixture_dir: str, source: str, key: str, page: str):
+    path = fixture_path(fixture_dir, source, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    log.info('Saved %s (%d KB)' % (path, len(page) // 1024))
+
+
+def record(fixture_dir: str, stocks: List[str], sources=all_sources):
+    import dividend_getter
+
+    dividend_getter.DividendWebsite.cache = None
+    for source in sources:
+        getter = dividend_getter.all_dividend_getters[source]
+        if source == 'moneydj':
+            write_fixture(fixture_dir, source, moneydj_key, getter.get_web_page(getter.query_url))
+            continue
+
+        for stock_id in stocks:
+            url = getter.query_url % stock_id
+            getter.throttle(url)
+            if source == 'goodinfo':
+                page = getter.fetch_page(url)
+            else:
+                page = getter.get_web_page(url)
+            if page is None:
+                log.error('Failed to record %s of %s' % (source, stock_id))
+                continue
+            write_fixture(fixture_dir, source, stock_id, page)
+
+
+def synthesize(fixture_dir: str, nr_stock: int = 50, nr_market_row: int = 2000, seed: int = 0):
+    ''' Pages with the markup the getters parse, padded like the real sites '''
+    rnd = random.Random(seed)
+    padding = ''.join('<div class="nav"><a href="#%d">menu %d</a><span>item</span></div>' % (i, i)
+                      for i in range(300))
+    stocks = ['%04d' % (1101 + i) for i in range(nr_market_row)]
+
+    rows = []
+    for stock_id in stocks:
+        rows.append("<tr><td class='t3t1'><script>GenLink2stk('AS%s','股票%s');</script></td>"
+                    "<td class='t3n1'>2024/%02d/%02d</td><td>%.2f</td><td>%.2f</td>"
+                    "<td>%.4f</td><td>2024/%02d/%02d</td></tr>" %
+                    (stock_id, stock_id, rnd.randint(6, 8), rnd.randint(1, 28),
+                     rnd.random() * 100, rnd.random() * 5, rnd.random() * 5,
+                     rnd.randint(9, 11), rnd.randint(1, 28)))
+    write_fixture(fixture_dir, 'moneydj', moneydj_key,
+                  '<html><head><title>ZEB</title></head><body>%s<table>%s</table>%s</body></html>' %
+                  (padding, ''.join(rows), padding))
+
+    for stock_id in stocks[:nr_stock]:
+        cash = rnd.random() * 5
+        moneylink = (
+            '<html><head><meta name="keywords" content="stock,股票%s%s"></head><body>%s'
+            '<table><tr><th id="HEAD1">除權</th><th id="HEAD1">除息</th><th id="HEAD1">合計</th></tr>'
+            '<tr><td>a</td><td>b</td><td>2024/07/%02d<span class="mg">(一)</span></td></tr>'
+            '<tr><td>a</td><td>b</td><td>2024/08/%02d<span class="mg">(二)</span></td></tr>'
+            '<tr><td>%.4f</td></tr><tr><td>-</td></tr></table>%s</body></html>' %
+            (stock_id, stock_id, padding, rnd.randint(1, 28), rnd.randint(1, 28), cash, padding))
+        write_fixture(fixture_dir, 'moneylink', stock_id, moneylink)
+
+        detail_rows = []
+        for year in range(24, 14, -1):
+            cols = ['<td>%d</td>' % i for i in range(18)]
+            cols[3] = "<td>'%02d/07/%02d</td>" % (year, rnd.randint(1, 28))
+            cols[7] = "<td>'%02d/08/%02d</td>" % (year, rnd.randint(1, 28))
+            cols[14] = '<td>%.2f</td>' % (rnd.random() * 5)
+            cols[17] = '<td>%.2f</td>' % (rnd.random())
+            detail_rows.append('<tr align="center">%s</tr>' % ''.join(cols))
+        goodinfo = (
+            '<html><body>%s<table class="b1 r10_0 box_shadow"><tr><td>a</td><td>b</td>'
+            '<td>%s 股票%s</td></tr></table><div id="divDetail"><table>%s</table></div>%s'
+            '</body></html>' % (padding, stock_id, stock_id, ''.join(detail_rows), padding))
+        write_fixture(fixture_dir, 'goodinfo', stock_id, goodinfo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record or synthesize benchmark fixtures.')
+    parser.add_argument('action', choices=['record', 'synthesize'])
+    parser.add_argument('-d', '--fixture-dir', default=default_fixture_dir,
+                        help='default value is %(default)s')
+    parser.add_argument('-s', '--stocks', nargs='+', default=['2330', '0050', '00878'],
+                        help='Stocks to record, default value is %(default)s')
+    parser.add_argument('--sources', nargs='+', default=all_sources, choices=all_sources)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)7s] %(name)s %(message)s')
+    if args.action == 'record':
+        record(args.fixture_dir, args.stocks, args.sources)
+    else:
+        synthesize(args.fixture_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+'''
+Local HTTP server replaying recorded fixtures, with configurable latency
+and error rate, so getters and the batch pipeline run without network.
+
+    /<source>/<key>     the fixture <source>/<key>.html
+
+A stock without its own fixture is answered with one of the recorded
+pages of that source, so watch lists of any size can be replayed.
+'''
+import argparse
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fixtures import default_fixture_dir, fixture_path, list_fixtures, moneydj_key
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency > 0:
+            time.sleep(server.latency)
+        if server.error_rate > 0 and server.random() < server.error_rate:
+            self.send_body(503, b'')
+            return
+
+        parts = self.path.strip('/').split('/')
+        body = server.get_page(*parts) if len(parts) == 2 else None
+        if body is None:
+            self.send_body(404, b'')
+        else:
+            self.send_body(200, body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixture_dir: str = default_fixture_dir, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0, port: int = 0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.fixture_dir = fixture_dir
+        self.fixtures = list_fixtures(fixture_dir)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.nr_request = 0
+        self.thread = None
+
+    def random(self) -> float:
+        with self.lock:
+            return self.rnd.random()
+
+    def count_request(self):
+        with self.lock:
+            self.nr_request += 1
+
+    def get_page(self, source: str, key: str) -> bytes:
+        keys = self.fixtures.get(source)
+        if not keys:
+            return None
+        if key not in keys:
+            key = keys[zlib.crc32(key.encode()) % len(keys)]
+        with self.lock:
+            body = self.pages.get((source, key))
+        if body is None:
+            with open(fixture_path(self.fixture_dir, source, key), 'rb') as f:
+                body = f.read()
+            with self.lock:
+                self.pages[(source, key)] = body
+        return body
+
+    @property
+    def base_url(self) -> str:
+        return 'http://127.0.0.1:%d' % self.server_port
+
+    def query_url(self, source: str) -> str:
+        if source == 'moneydj':
+            return '%s/moneydj/%s' % (self.base_url, moneydj_key)
+        return '%s/%s/%%s' % (self.base_url, source)
+
+    def point_getters(self, getters):
+        ''' Make getters fetch from this server instead of the websites '''
+        for getter in getters:
+            getter.query_url = self.query_url(getter.name)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded fixtures.')
+    parser.add_argument('-d', '--fixture-dir', default=default_fixture_dir)
+    parser.add_argument('-p', '--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before every answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction answered with 503')
+    args = parser.parse_args()
+
+    server = StubServer(args.fixture_dir, args.latency, args.error_rate, port=args.port)
+    print('Serving %s at %s' % (args.fixture_dir, server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import List
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_max_pages = 2
+default_page_timeout_ms = 30000
+# Resources not needed to read the html table
+default_blocked_resource_types = ('image', 'font', 'stylesheet', 'media')
+
+
+class BrowserPool:
+    '''
+    A headless Chromium that lives as long as the process. The browser runs
+    on its own event loop thread, so synchronous getters called from any
+    thread can share it. At most max_pages pages are open at the same time
+    and idle pages are reused by the next fetch.
+    '''
+    def __init__(self, max_pages: int = default_max_pages,
+                 page_timeout_ms: int = default_page_timeout_ms,
+                 blocked_resource_types=default_blocked_resource_types):
+        self.max_pages = max_pages
+        self.page_timeout_ms = page_timeout_ms
+        self.blocked_resource_types = set(blocked_resource_types)
+
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.semaphore = None
+        self.launch_lock = None
+        self.idle_pages: List = []
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever,
+                                           name='browser-pool', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    async def _block_resource(self, route):
+        if route.request.resource_type in self.blocked_resource_types:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _ensure_context(self):
+        if self.launch_lock is None:
+            self.launch_lock = asyncio.Lock()
+        async with self.launch_lock:
+            if self.context is not None:
+                return
+            # imported here so playwright is only needed when goodinfo is used
+            from playwright.async_api import async_playwright
+
+            log.debug('launch headless chromium')
+            self.semaphore = asyncio.Semaphore(self.max_pages)
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=True)
+            self.context = await self.browser.new_context()
+            self.context.set_default_timeout(self.page_timeout_ms)
+            await self.context.route('**/*', self._block_resource)
+
+    async def _fetch(self, url: str, wait_selector: str = None) -> str:
+        await self._ensure_context()
+        async with self.semaphore:
+            page = self.idle_pages.pop() if self.idle_pages else await self.context.new_page()
+            try:
+                await page.goto(url, timeout=self.page_timeout_ms)
+                if wait_selector:
+                    try:
+                        # waits across the JavaScript redirect as well
+                        await page.wait_for_selector(wait_selector, state='attached',
+                                                     timeout=self.page_timeout_ms)
+                    except Exception as err:
+                        log.warning('%s did not appear in %s: %s' % (wait_selector, url, err))
+                content = await page.content()
+            except BaseException:   # also when a timed out fetch is cancelled
+                await page.close()
+                raise
+            self.idle_pages.append(page)
+            return content
+
+    def fetch(self, url: str, wait_selector: str = None, timeout: float = None) -> str:
+        '''
+        timeout in seconds covers waiting for a free page, the browser
+        launch, the navigation and the selector, by default three times
+        the page timeout
+        '''
+        self.start()
+        if timeout is None:
+            timeout = self.page_timeout_ms / 1000 * 3
+        future = asyncio.run_coroutine_threadsafe(self._fetch(url, wait_selector), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError('Fetching %s took more than %.0f seconds' % (url, timeout))
+
+    async def _close(self):
+        for page in self.idle_pages:
+            await page.close()
+        self.idle_pages = []
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.context = self.browser = self.playwright = None
+        self.launch_lock = None
+
+    def close(self):
+        with self.lock:
+            if self.loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+            except Exception as err:
+                log.warning('Failed to close browser: %s' % err)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            self.thread = None
@@ -0,0 +1,137 @@
+from atomic_file import write_atomic
+from datetime import date, datetime
+from dividend_info import DividendInfo, DividendRecord
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_state_file = '~/.local/share/stock-robot/dividend_fingerprint.json'
+
+change_new = 'new'
+change_changed = 'changed'
+change_cancelled = 'cancelled'
+
+
+def get_fingerprint(records: List[DividendRecord]) -> str:
+    ''' Hash of the dates and amounts of a record set '''
+    text = '\n'.join('%s|%s|%.4f|%.4f' % (r.div_date, r.payable_date, r.cash, r.stock) for r in records)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def is_event(r: DividendRecord) -> bool:
+    # the placeholder record of a stock without any event has no date
+    return r.div_date is not None or r.payable_date is not None
+
+
+def is_upcoming(r: DividendRecord, today: date) -> bool:
+    return any(d is not None and d >= today for d in (r.div_date, r.payable_date))
+
+
+def make_change(info: DividendInfo, change: str, record: DividendRecord,
+                previous: DividendRecord = None) -> dict:
+    return {
+        'stock_id': info.stock_id,
+        'stock_name': info.stock_name,
+        'change': change,
+        'record': record.to_dict(),
+        'previous': None if previous is None else previous.to_dict(),
+    }
+
+
+def diff_records(info: DividendInfo, old: List[DividendRecord], today: date) -> List[dict]:
+    '''
+    Events are matched by div_date. Only events that have not passed yet
+    are new, older ones were just seen for the first time. Only events
+    before their ex-date are cancelled, and never by a result without any
+    event. A missing event and a new one of the same stock are paired as
+    a date change.
+    '''
+    old_events = {r.div_date: r for r in old if is_event(r)}
+    new_events = {r.div_date: r for r in info.div_record if is_event(r)}
+
+    changes = []
+    added = []
+    for div_date, r in new_events.items():
+        previous = old_events.get(div_date)
+        if previous is None:
+            if is_upcoming(r, today):
+                added.append(r)
+        elif previous != r:
+            changes.append(make_change(info, change_changed, r, previous))
+    # an event whose ex-date has passed may just have dropped out of a
+    # listing before it was paid, and a placeholder lists no event at all
+    removed = []
+    if new_events:
+        removed = [r for div_date, r in old_events.items()
+                   if div_date not in new_events and div_date is not None and div_date >= today]
+
+    for r, previous in zip(added, removed):
+        changes.append(make_change(info, change_changed, r, previous))
+    for r in added[len(removed):]:
+        changes.append(make_change(info, change_new, r))
+    for previous in removed[len(added):]:
+        changes.append(make_change(info, change_cancelled, previous, previous))
+    return changes
+
+
+class ChangeDetector:
+    '''
+    Keeps the fingerprint and the latest records of every stock in a small
+    json file. A run compares each stock's fingerprint with the saved one
+    and only diffs the few records of the stocks whose fingerprint moved,
+    so the cost follows the watch list, not the history.
+    '''
+    def __init__(self, path: str = default_state_file):
+        self.path = os.path.expanduser(path)
+        self.state: Dict[str, dict] = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            log.warning('Ignore broken fingerprint state %s: %s' % (self.path, err))
+            return {}
+
+    def detect(self, div_info: Dict[str, DividendInfo], today: date = None) -> List[dict]:
+        today = today or date.today()
+        changes = []
+        for stock_id, info in div_info.items():
+            # a failed lookup says nothing about the events
+            if info.error is not None and not info.div_record:
+                continue
+            fingerprint = get_fingerprint(info.div_record)
+            saved = self.state.get(stock_id)
+            if saved is not None and saved['fingerprint'] == fingerprint:
+                continue
+
+            old = [] if saved is None else [DividendRecord.from_dict(r) for r in saved['div_record']]
+            if not any(is_event(r) for r in info.div_record) and any(is_event(r) for r in old):
+                # a placeholder, keep the known events so they are not new again next time
+                continue
+            changes.extend(diff_records(info, old, today))
+            self.state[stock_id] = {
+                'fingerprint': fingerprint,
+                'div_record': [r.to_dict() for r in info.div_record],
+            }
+        log.info('%d changes in %d stocks' % (len(changes), len(div_info)))
+        return changes
+
+    def save(self):
+        try:
+            write_atomic(self.path, json.dumps(self.state, ensure_ascii=False))
+        except OSError as err:
+            log.warning('Failed to save fingerprint state: %s' % err)
+
+
+def write_changes(path: str, changes: List[dict]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'generated_at': datetime.now().isoformat(timespec='seconds'),
+                   'changes': changes}, f, indent=2, ensure_ascii=False)
+    log.debug('%d changes written to %s' % (len(changes), path))
@@ -0,0 +1,153 @@
+from atomic_file import write_atomic
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_state_file = '~/.local/share/stock-robot/circuit_breaker.json'
+default_failure_threshold = 5
+# in seconds
+default_cooldown = 30 * 60
+
+state_closed = 'closed'
+state_open = 'open'
+state_half_open = 'half_open'
+
+
+class CircuitBreaker:
+    '''
+    closed:    requests go through, consecutive failures are counted
+    open:      requests are skipped until the cooldown has passed
+    half_open: a single probe request is let through; success closes the
+               circuit again, failure opens it for another cooldown
+    '''
+    def __init__(self, name: str,
+                 failure_threshold: int = default_failure_threshold,
+                 cooldown: float = default_cooldown,
+                 on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.state = state_closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        log.warning('Circuit of %s is %s (%d consecutive failures)' %
+                    (self.name, state, self.failures))
+        self.state = state
+        if self.on_change is not None:
+            self.on_change()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == state_closed:
+                return True
+            if self.probing:
+                return False
+            if time.time() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            self._set_state(state_half_open)
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            self._set_state(state_closed)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == state_half_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                self.probing = False
+                # _set_state is a no-op for open -> open, still save the new opened_at
+                if self.state == state_open and self.on_change is not None:
+                    self.on_change()
+                self._set_state(state_open)
+
+    def to_dict(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened_at': self.opened_at,
+        }
+
+    def load_dict(self, d: dict):
+        self.state = d.get('state', state_closed)
+        self.failures = d.get('failures', 0)
+        self.opened_at = d.get('opened_at', 0.0)
+        # nobody is probing in this process, wait for the cooldown again
+        if self.state == state_half_open:
+            self.state = state_open
+
+
+class CircuitBreakerStore:
+    '''
+    One CircuitBreaker per source, saved to a small json file whenever a
+    circuit opens or closes so the state survives across cron runs.
+    With path None the state is only kept in memory.
+    '''
+    def __init__(self, path: str = None,
+                 failure_threshold: int = default_failure_threshold,
+                 cooldown: float = default_cooldown):
+        self.path = os.path.expanduser(path) if path else None
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # to_dict() of every breaker when it was loaded or last saved
+        self.saved_breakers: Dict[str, dict] = {}
+        self.saved_state = self._load()
+
+    def _load(self) -> dict:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            log.warning('Ignore broken circuit breaker state %s: %s' % (self.path, err))
+            return {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self.lock:
+            breaker = self.breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self.failure_threshold, self.cooldown,
+                                         on_change=self.save)
+                breaker.load_dict(self.saved_state.get(name, {}))
+                self.breakers[name] = breaker
+                self.saved_breakers[name] = breaker.to_dict()
+            return breaker
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            # other processes, e.g. batch workers, may have saved meanwhile:
+            # only breakers that changed in this process replace their entry
+            state = self._load()
+            for name, breaker in self.breakers.items():
+                breaker_state = breaker.to_dict()
+                if breaker_state != self.saved_breakers[name]:
+                    state[name] = breaker_state
+                    self.saved_breakers[name] = breaker_state
+            self.saved_state = state
+            try:
+                write_atomic(self.path, json.dumps(state, indent=2))
+            except OSError as err:
+                log.warning('Failed to save circuit breaker state: %s' % err)
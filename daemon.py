@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+'''
+Keep the getters warm and the latest DividendInfo of a watch list in
+memory, refresh them on a schedule and answer queries over local HTTP:
+
+    GET /dividend/<stock_id>            to_dict() of one stock
+    GET /dividend?stock_id=A&stock_id=B {stock_id: to_dict()}
+    GET /dividends                      every stock of the watch list
+    GET /health                         refresh time and number of stocks
+
+A stock outside the watch list is fetched on first query and, if
+something was found, kept up to date like the others. Otherwise the
+answer is reused until the next refresh. Stock ids must
+look like one, e.g. 2330 or 00878, anything else is answered with 400.
+'''
+import argparse
+from datetime import datetime
+from dividend_info import DividendInfo
+import dividend_getter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import re
+import socketserver
+import threading
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_host = '127.0.0.1'
+default_port = 8321
+# in seconds
+default_refresh_interval = 6 * 60 * 60
+
+stock_id_pattern = re.compile(r'^[0-9A-Z]{4,6}$')
+
+
+def is_valid_stock_id(stock_id: str) -> bool:
+    return stock_id_pattern.match(stock_id) is not None
+
+
+class DividendDaemon:
+    def __init__(self, stocks: List[str], getter_names: List[str],
+                 refresh_interval: float = default_refresh_interval,
+                 sleep_interval: float = dividend_getter.default_sleep_interval,
+                 max_concurrency: int = dividend_getter.default_max_concurrency,
+                 strategy: str = dividend_getter.default_strategy):
+        self.stocks = list(dict.fromkeys(stocks))
+        self.getters = dividend_getter.get_dividend_getters(getter_names)
+        self.refresh_interval = refresh_interval
+        self.sleep_interval = sleep_interval
+        self.max_concurrency = max_concurrency
+        self.strategy = strategy
+        # a cached page must not outlive a refresh
+        for getter in self.getters:
+            getter.cache_ttl = min(getter.cache_ttl, refresh_interval)
+
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.div_info: Dict[str, DividendInfo] = {}
+        # answers are encoded once per refresh, not per query
+        self.encoded: Dict[str, bytes] = {}
+        # answers of unwatched stocks nothing was found of, until the next refresh
+        self.not_found: Dict[str, bytes] = {}
+        self.refreshed_at = None
+
+    def _store(self, div_info: Dict[str, DividendInfo]):
+        encoded = {stock_id: json.dumps(info.to_dict(), ensure_ascii=False).encode('utf-8')
+                   for stock_id, info in div_info.items()}
+        with self.lock:
+            self.div_info.update(div_info)
+            self.encoded.update(encoded)
+
+    def refresh(self):
+        with self.refresh_lock:
+            start = time.monotonic()
+            # market-wide listings are refreshed in a few requests before the lookups
+            for getter in self.getters:
+                if getter.get_listing_urls():
+                    getter.load_listing()
+
+            with self.lock:
+                stocks = list(self.stocks)
+            div_info = dividend_getter.get_many_dividend_info(stocks, self.getters,
+                                                              sleep_interval=self.sleep_interval,
+                                                              max_concurrency=self.max_concurrency,
+                                                              strategy=self.strategy)
+            self._store(div_info)
+            with self.lock:
+                self.not_found.clear()
+            self.refreshed_at = datetime.now()
+            log.info('Refreshed %d stocks in %.1f seconds' % (len(stocks), time.monotonic() - start))
+
+    def run_refresher(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as err:
+                log.exception('Refresh failed: %s' % err)
+            self.stop_event.wait(self.refresh_interval)
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run_refresher, name='refresher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def lookup(self, stock_id: str) -> bytes:
+        with self.lock:
+            encoded = self.encoded.get(stock_id) or self.not_found.get(stock_id)
+            known = stock_id in self.stocks
+        if encoded is not None or known:
+            return encoded
+        if not is_valid_stock_id(stock_id):
+            raise ValueError('%s is not a stock id' % stock_id)
+
+        # not watched yet, fetch it now and keep it fresh from now on
+        info = dividend_getter.get_dividend_info(stock_id, self.getters, strategy=self.strategy)
+        info = dividend_getter.check_div_info(stock_id, info)
+        if info.error is not None or not dividend_getter.has_dated_record(info):
+            # not worth a request every refresh, nor on every query
+            log.info('Nothing found for %s, not watching it' % stock_id)
+            encoded = json.dumps(info.to_dict(), ensure_ascii=False).encode('utf-8')
+            with self.lock:
+                self.not_found[stock_id] = encoded
+            return encoded
+
+        log.info('Add %s to the watch list' % stock_id)
+        self._store({stock_id: info})
+        with self.lock:
+            if stock_id not in self.stocks:
+                self.stocks.append(stock_id)
+            return self.encoded[stock_id]
+
+    def lookup_all(self, stock_ids: List[str] = None) -> bytes:
+        if stock_ids is None:
+            with self.lock:
+                items = list(self.encoded.items())
+        else:
+            items = [(stock_id, self.lookup(stock_id)) for stock_id in stock_ids]
+        return b'{' + b','.join(json.dumps(stock_id).encode('utf-8') + b':' + (encoded or b'null')
+                                for stock_id, encoded in items) + b'}'
+
+    def health(self) -> bytes:
+        with self.lock:
+            nr_stock = len(self.encoded)
+        return json.dumps({
+            'refreshed_at': self.refreshed_at.isoformat(timespec='seconds') if self.refreshed_at else None,
+            'nr_stock': nr_stock,
+        }).encode('utf-8')
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self) -> str:
+        # client_address is empty on a unix socket
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        log.debug('%s %s' % (self.address_string(), format % args))
+
+    def send_json(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        daemon = self.server.dividend_daemon
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+
+        if parts == ['health']:
+            self.send_json(200, daemon.health())
+        elif parts == ['dividends']:
+            self.send_json(200, daemon.lookup_all())
+        elif parts == ['dividend']:
+            stock_ids = parse_qs(url.query).get('stock_id', [])
+            try:
+                self.send_json(200, daemon.lookup_all(stock_ids))
+            except ValueError:
+                self.send_json(400, b'{"error": "invalid stock id"}')
+        elif len(parts) == 2 and parts[0] == 'dividend':
+            try:
+                body = daemon.lookup(parts[1])
+            except ValueError:
+                self.send_json(400, b'{"error": "invalid stock id"}')
+                return
+            if body is None:    # watched, but the first refresh has not finished
+                self.send_json(503, b'{"error": "not ready"}')
+            else:
+                self.send_json(200, body)
+        else:
+            self.send_json(404, b'{"error": "not found"}')
+
+
+class DaemonHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, daemon: DividendDaemon):
+        super().__init__(address, DaemonHandler)
+        self.dividend_daemon = daemon
+
+
+class DaemonUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: DividendDaemon):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, DaemonHandler)
+        self.dividend_daemon = daemon
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description='Ex-dividend query daemon.')
+
+    stock_arg = parser.add_mutually_exclusive_group(required=True)
+    stock_arg.add_argument('-s', '--stocks', nargs='+',
+                           help='Specify watching stock id')
+    stock_arg.add_argument('-l', '--stock-list-file',
+                           type=argparse.FileType('r'),
+                           help='Specify watch list file of interesting stock list')
+
+    parser.add_argument('-g', '--getters', nargs='+', default=['moneydj'],
+                        choices=list(dividend_getter.all_dividend_getters),
+                        help='Websites to get dividend data from, in order of preference, '
+                             'default value is %(default)s')
+    parser.add_argument('-r', '--refresh-interval', type=int, default=default_refresh_interval,
+                        help='Seconds between refreshes, default value is %(default)s')
+    parser.add_argument('-i', '--sleep-interval', type=int, default=dividend_getter.default_sleep_interval,
+                        help='Sleep interval in seconds, default value is %(default)s (seconds)')
+    parser.add_argument('--host', default=default_host,
+                        help='Address to listen on, default value is %(default)s')
+    parser.add_argument('-p', '--port', type=int, default=default_port,
+                        help='Port to listen on, default value is %(default)s')
+    parser.add_argument('-u', '--unix-socket',
+                        help='Listen on this unix socket instead of TCP')
+    parser.add_argument('-v', '--verbosity', action="count", default=0,
+                        help='increase output verbosity')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+
+    log_format = '[%(levelname)7s] %(asctime)s %(name)s %(message)s'
+    if args.verbosity >= 2:
+        logging.basicConfig(level=logging.DEBUG, format=log_format)
+    elif args.verbosity >= 1:
+        logging.basicConfig(level=logging.INFO, format=log_format)
+    else:
+        logging.basicConfig(level=logging.ERROR, format=log_format)
+
+    if args.stocks is None:
+        stocks = [s for s in args.stock_list_file.read().splitlines() if s]
+    else:
+        stocks = args.stocks
+
+    daemon = DividendDaemon(stocks, args.getters,
+                            refresh_interval=args.refresh_interval,
+                            sleep_interval=args.sleep_interval)
+    daemon.start()
+
+    if args.unix_socket:
+        server = DaemonUnixServer(args.unix_socket, daemon)
+        log.info('Listening on %s' % args.unix_socket)
+    else:
+        server = DaemonHTTPServer((args.host, args.port), daemon)
+        log.info('Listening on %s:%d' % (args.host, args.port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
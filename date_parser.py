@@ -0,0 +1,43 @@
+from datetime import date
+from functools import lru_cache
+import re
+
+# ROC (民國) year 1 is 1912
+roc_year_offset = 1911
+default_cache_size = 4096
+
+# Anything after the day but another digit is ignored, e.g. the weekday
+# goodinfo appends
+date_pattern = re.compile(r"\s*(')?(\d{1,4})[/-](\d{1,2})[/-](\d{1,2})(?!\d)")
+
+
+@lru_cache(maxsize=default_cache_size)
+def parse_date(text: str) -> date:
+    '''
+    Date of 2024/07/15 or 2024-07-15, ROC year 113/07/15, or the two-digit
+    year '24/07/15 of goodinfo. None for anything else, including empty
+    text and impossible dates.
+    '''
+    if not text:
+        return None
+    m = date_pattern.match(text)
+    if m is None:
+        return None
+
+    quoted, year_text, month, day = m.groups()
+    year = int(year_text)
+    if quoted:
+        if len(year_text) != 2:
+            return None
+        # the same pivot as strptime('%y')
+        year += 2000 if year < 69 else 1900
+    elif len(year_text) == 3:
+        year += roc_year_offset
+    elif len(year_text) != 4:
+        # a two-digit year is only known with goodinfo's quote
+        return None
+
+    try:
+        return date(year, int(month), int(day))
+    except ValueError:
+        return None
@@ -1,25 +1,78 @@
-from bs4 import BeautifulSoup
+from __future__ import annotations
+
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 from dividend_info import DividendInfo, DividendRecord
 import logging
 import os
+import string
+import threading
 import time
 import traceback
-from typing import Dict, List
-import urllib
-import urllib.request
-from urllib.error import HTTPError, URLError
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
 
 import asyncio
-from playwright.async_api import async_playwright
+
+from browser_pool import BrowserPool
+from circuit_breaker import CircuitBreaker, CircuitBreakerStore
+from date_parser import parse_date
+from http_cache import HttpCache, default_cache_ttl
+from http_transport import default_transport
+from listing_snapshot import default_snapshot_dir, get_snapshot_path, open_snapshot, write_snapshot
+from metrics import metrics
+from rate_limiter import host_rate_limiter
+
+if TYPE_CHECKING:
+    # bs4 is imported when the first page is parsed, see html_parser
+    from bs4 import BeautifulSoup, SoupStrainer
 
 log = logging.getLogger(os.path.basename(__file__))
 
 # To prevent DOS protection, in seconds
 default_sleep_interval = 2
 default_max_nr_record = 1
+# Number of stocks looked up at the same time in the async batch mode
+default_max_concurrency = 8
+
+# How get_dividend_info combines the getters, see async_get_dividend_info
+strategy_sequential = 'sequential'
+strategy_race = 'race'
+strategy_hedged = 'hedged'
+all_strategies = (strategy_sequential, strategy_race, strategy_hedged)
+default_strategy = strategy_sequential
+# Runs the blocking getters for the async batch mode
+getter_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='getter')
+
+# Shared by every DividendGoodinfo so one Chromium serves the whole batch
+goodinfo_browser_pool = BrowserPool()
+
+
+def set_request_timeout(seconds: float):
+    ''' Limit every web request and browser navigation, the default is 30 seconds '''
+    default_transport.timeout = seconds
+    goodinfo_browser_pool.page_timeout_ms = int(seconds * 1000)
 
 class DividendWebsite:
+    # Whether fetches from this site go through the per-host rate limiter
+    throttled = True
+    # Shared on-disk page cache, None to always fetch from network
+    cache = HttpCache()
+    cache_ttl = default_cache_ttl
+    transport = default_transport
+    # In hedged mode, seconds to wait for this site before asking the next one
+    hedge_delay = 5.0
+    # Skip a site that keeps failing, None to always try it
+    circuit_breakers = CircuitBreakerStore()
+    # Market-wide pages listing many stocks at once, e.g. the pages of an
+    # ex-dividend schedule. Fetched once per run and indexed by stock_id,
+    # stocks not listed there are fetched one by one.
+    listing_urls: Tuple[str, ...] = ()
+    # Parsed listings are shared with other processes as a snapshot here
+    # for cache_ttl, None to always fetch and parse them
+    listing_snapshot_dir = default_snapshot_dir
+
     def __init__(self, name: str = None):
         # use derived class name to create logger
         self.log = logging.getLogger(self.__class__.__name__)
@@ -27,69 +80,223 @@ class DividendWebsite:
             self.name = self.__class__.__name__
         else:
             self.name = name
+        # stock_id -> (stock_name, div_record) of the listing pages, loaded or
+        # mapped from a snapshot by the first lookup
+        self.listing: Mapping[str, Tuple[str, List[DividendRecord]]] = None
+        self.listing_lock = threading.Lock()
+        # .failed is set when the site itself fails during the lookup of a thread
+        self.site_failure = threading.local()
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.query_url).netloc
+
+    def throttle(self, url: str):
+        if self.throttled:
+            host = urlsplit(url).netloc
+            metrics.observe('throttle.%s' % host, host_rate_limiter.acquire(host))
+
+    def mark_site_failure(self):
+        self.site_failure.failed = True
+
+    def site_failed(self) -> bool:
+        return getattr(self.site_failure, 'failed', False)
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        if self.circuit_breakers is None:
+            return None
+        return self.circuit_breakers.get(self.name)
 
     def get_web_page(self, url: str):
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and entry.is_fresh(self.cache_ttl):
+            self.log.debug('use cached web page of %s' % url)
+            metrics.incr('cache_hit.%s' % self.name)
+            return entry.body
+
         self.log.debug('fetch web page from %s' % url)
-        req = urllib.request.Request(
-                url,
-                data=None,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) '
-                                  'Chrome/35.0.1916.47 Safari/537.36 '
-                })
-
-        retry_cnt = 0
-        max_retry = 2
-        retry_interval_sec = 2
-        while retry_cnt < max_retry:
-            try:
-                response = urllib.request.urlopen(url)
-                encoding = response.info().get_content_charset() or 'utf-8'
-                html_bytes = response.read()
-                html_string = html_bytes.decode(encoding, 'ignore')
-                return html_string
-            except Exception as err:
-                self.log.warning("Exception occured: %s" % err)
-                self.log.debug("Retry (%d) after %d second.." % (retry_cnt, retry_interval_sec))
-                time.sleep(retry_interval_sec)
-                retry_cnt += 1
-        return None
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) '
+                          'Chrome/35.0.1916.47 Safari/537.36 '
+        }
+        if entry is not None:
+            headers.update(entry.validators())
+
+        try:
+            response = self.transport.request(url, headers, before_request=self.throttle)
+        except Exception as err:
+            self.log.warning("Exception occured: %s" % err)
+            metrics.incr('fetch_error.%s' % self.name)
+            self.mark_site_failure()
+            return None
+        self.log.debug('fetched %s' % response)
+        metrics.observe('fetch.%s' % self.name, response.elapsed)
+        metrics.incr('bytes.%s' % self.name, response.wire_bytes)
+        metrics.incr('page_bytes.%s' % self.name, len(response.body))
+        metrics.incr('retry.%s' % self.name, response.attempts - 1)
+
+        if response.status == 304 and entry is not None:
+            self.log.debug('web page of %s not modified' % url)
+            self.cache.refresh(entry)
+            return entry.body
+        if response.status != 200:
+            self.log.warning("Failed to fetch %s: HTTP %d" % (url, response.status))
+            self.mark_site_failure()
+            return None
 
+        html_string = response.text()
+        if not self.is_valid_page(html_string):
+            # do not keep a block or maintenance page for a whole ttl
+            self.log.warning('%s is not a page of %s, probably blocked or in maintenance' % (url, self.name))
+            self.mark_site_failure()
+        elif self.cache is not None:
+            self.cache.put(url, html_string,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+        return html_string
+
+
+    def is_valid_page(self, html: str) -> bool:
+        '''
+        Whether a fetched page is a page of the site, not a block or
+        maintenance page. Only such pages are cached, others count as a
+        failure of the site.
+        '''
+        return True
 
     def get_web_soup(self, url: str) -> BeautifulSoup:
+        from html_parser import make_soup
         page = self.get_web_page(url)
-        soup = BeautifulSoup(page, 'html.parser')
+        with metrics.timer('parse.%s' % self.name):
+            soup = make_soup(page, self.get_parse_only())
         return soup
 
-    def get_dividend_info(self, stock_id: str) -> DividendInfo:
+    def get_parse_only(self) -> SoupStrainer:
+        ''' Only the parts of the page the getter reads are parsed, None for all '''
+        return None
+
+    def get_listing_urls(self) -> List[str]:
+        return list(self.listing_urls)
+
+    def parse_listing(self, soup: BeautifulSoup) -> Dict[str, Tuple[str, List[DividendRecord]]]:
+        ''' stock_id -> (stock_name, div_record) of one listing page '''
+        self.log.critical('To be implemented by derived class')
+        return {}
+
+    def load_listing(self, use_snapshot: bool = True):
+        snapshot_path = None
+        if self.listing_snapshot_dir is not None:
+            snapshot_path = get_snapshot_path(self.listing_snapshot_dir, self.name)
+            snapshot = open_snapshot(snapshot_path, self.cache_ttl) if use_snapshot else None
+            if snapshot is not None:
+                self.log.debug('Use snapshot of %d stocks from %s' % (len(snapshot), snapshot_path))
+                metrics.incr('snapshot_hit.%s' % self.name)
+                self.listing = snapshot
+                return
+
+        listing = {}
+        for url in self.get_listing_urls():
+            soup = self.get_web_soup(url)
+            with metrics.timer('extract.%s' % self.name):
+                page_listing = self.parse_listing(soup)
+            # a stock on several pages keeps its first, most recent, entry
+            for stock_id, found in page_listing.items():
+                listing.setdefault(stock_id, found)
+            self.log.debug('Indexed %d stocks from %s' % (len(page_listing), url))
+        self.listing = listing
+
+        # an empty listing is more likely a blocked or changed page than an empty market
+        if snapshot_path is not None and listing:
+            try:
+                write_snapshot(snapshot_path, listing)
+            except OSError as err:
+                self.log.warning('Failed to write snapshot %s: %s' % (snapshot_path, err))
+
+    def ensure_listing(self) -> Mapping[str, Tuple[str, List[DividendRecord]]]:
+        with self.listing_lock:
+            if self.listing is None:
+                self.load_listing()
+            return self.listing
+
+    def prefetch(self):
+        ''' Load the listing pages before a batch, so no lookup waits for them '''
+        if self.get_listing_urls():
+            self.ensure_listing()
+
+    def get_listed_dividend_info(self, stock_id: str) -> DividendInfo:
+        found = self.ensure_listing().get(stock_id)
+        if found is None:
+            return None
+        stock_name, div_record = found
+        info = DividendInfo(stock_id, stock_name=stock_name)
+        info.div_record = list(div_record)
+        return info
+
+    def fetch_dividend_info(self, stock_id: str) -> DividendInfo:
+        ''' Look up a stock on its own page '''
         self.log.critical('To be implemented by derived class')
         pass
 
+    def get_dividend_info(self, stock_id: str) -> DividendInfo:
+        if self.get_listing_urls():
+            info = self.get_listed_dividend_info(stock_id)
+            if info is not None:
+                return info
+        return self.fetch_dividend_info(stock_id)
+
 
 class DividendGoodinfo(DividendWebsite):
+    # A headless browser page takes a few seconds
+    hedge_delay = 10.0
+
     def __init__(self) -> None:
         super().__init__(name='goodinfo')
         self.query_url = 'https://goodinfo.tw/tw/StockDividendSchedule.asp?STOCK_ID=%s'
-        self.page_redirect_timeout_ms = 2000
+        self.browser_pool = goodinfo_browser_pool
 
 
-    async def fetch_page(self, url):
-        self.log.debug('fetch web page from %s' % url)
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            await page.goto(url)
-            await page.wait_for_timeout(self.page_redirect_timeout_ms)  # Wait for JavaScript redirect
-            content = await page.content()
-            await browser.close()
-            return content
+    def is_valid_page(self, html: str) -> bool:
+        return 'divDetail' in html
 
-        return None
+
+    def get_parse_only(self) -> SoupStrainer:
+        from html_parser import AnySoupStrainer, SoupStrainer
+        return AnySoupStrainer(SoupStrainer('div', attrs={'id': 'divDetail'}),
+                               SoupStrainer('table', attrs={'class': 'b1 r10_0 box_shadow'}))
+
+
+    def fetch_page(self, url):
+        self.log.debug('fetch web page from %s' % url)
+        # The dividend table is rendered after a JavaScript redirect
+        with metrics.timer('fetch.%s' % self.name):
+            content = self.browser_pool.fetch(url, wait_selector='#divDetail')
+        # the browser does not tell what went over the wire
+        metrics.incr('page_bytes.%s' % self.name, len(content))
+        return content
 
 
     def get_html_content(self, url):
-        html_content = asyncio.run(self.fetch_page(url))
-        soup = BeautifulSoup(html_content, 'html.parser')
+        from html_parser import make_soup
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and entry.is_fresh(self.cache_ttl):
+            self.log.debug('use cached web page of %s' % url)
+            metrics.incr('cache_hit.%s' % self.name)
+            html_content = entry.body
+        else:
+            self.throttle(url)
+            try:
+                html_content = self.fetch_page(url)
+            except Exception:
+                self.mark_site_failure()
+                raise
+            # do not keep the anti-bot or redirect page for a whole ttl
+            if not self.is_valid_page(html_content):
+                self.mark_site_failure()
+            elif self.cache is not None:
+                self.cache.put(url, html_content)
+        with metrics.timer('parse.%s' % self.name):
+            soup = make_soup(html_content, self.get_parse_only())
         return soup
 
 
@@ -100,8 +307,8 @@ class DividendGoodinfo(DividendWebsite):
         for row in rows:
             cols = row.find_all('td')
             cols = [ele.text.strip() for ele in cols]
-            div_date = datetime.strptime(cols[3][0:9], '\'%y/%m/%d').date() if len(cols[3]) > 0 else None
-            payable_date = datetime.strptime(cols[7][0:9], '\'%y/%m/%d').date() if len(cols[7]) > 0 else None
+            div_date = parse_date(cols[3])
+            payable_date = parse_date(cols[7])
             cash = float(cols[14])
             stock = float(cols[17])
             if cash == 0.0 and stock == 0.0:
@@ -118,10 +325,11 @@ class DividendGoodinfo(DividendWebsite):
         top = soup.find('table', attrs={'class': 'b1 r10_0 box_shadow'}).find_all('td')
         return top[2].text.split()[1]
 
-    def get_dividend_info(self, stock_id: str) -> DividendInfo:
+    def fetch_dividend_info(self, stock_id: str) -> DividendInfo:
         try:
             soup = self.get_html_content(self.query_url % stock_id)
-            div_data = self.parse_div_data(soup)
+            with metrics.timer('extract.%s' % self.name):
+                div_data = self.parse_div_data(soup)
         except Exception as err:
             self.log.error('Failed to parse goodinfo for %s:' % stock_id)
             self.log.error(err)
@@ -135,11 +343,24 @@ class DividendGoodinfo(DividendWebsite):
 
 
 class DividendMoneylink(DividendWebsite):
+    hedge_delay = 3.0
+
     def __init__(self) -> None:
         super().__init__(name='moneylink')
         self.query_url = 'https://ww2.money-link.com.tw/TWStock/StockBasic.aspx?SymId=%s'
 
 
+    def is_valid_page(self, html: str) -> bool:
+        # every stock page has the keywords parse_stockname() reads, even
+        # one of a stock without the 除息 table
+        return 'keywords' in html
+
+
+    def get_parse_only(self) -> SoupStrainer:
+        from html_parser import SoupStrainer
+        return SoupStrainer(['meta', 'table'])
+
+
     def parse_stockname(self, soup: BeautifulSoup, stock_id: str) -> str:
         try:
             name = soup.find('meta')['content'].split(',')[1]
@@ -152,21 +373,15 @@ class DividendMoneylink(DividendWebsite):
             return 'Unknown'
 
 
-    def chinese_date_to_ad_date(self, date_str: str):
-        _date_str = date_str.split('/')
-        _date_str[0] = str(int(_date_str[0]) + 1911)
-        return '/'.join(_date_str)
-
-
     def parse_div_table_etf(self, table) -> list[DividendRecord]:
         rows = table.find_all('tr')
         data = []
         for row in rows[2:]:  # skip row0 and row1 (title)
             cols = row.find_all('td')
             cols = [ele.text.strip() for ele in cols]
-            div_date = datetime.strptime(self.chinese_date_to_ad_date(cols[3]), '%Y/%m/%d').date() if len(cols[4]) > 0 else None
-            payable_date = datetime.strptime(self.chinese_date_to_ad_date(cols[5]), '%Y/%m/%d').date() if len(
-                cols[4]) > 0 else None
+            # dates are in ROC year
+            div_date = parse_date(cols[3]) if len(cols[4]) > 0 else None
+            payable_date = parse_date(cols[5]) if len(cols[4]) > 0 else None
             cash = float(cols[4])
             stock = 0
             d = DividendRecord(div_date, payable_date, cash, stock)
@@ -200,18 +415,16 @@ class DividendMoneylink(DividendWebsite):
         td = table.find_all('tr')[1].find_all('td')[2]
         for span in td.find_all('span', class_='mg'):
             span.decompose()
-        try:
-            div_date = datetime.strptime(td.text, '%Y/%m/%d').date()
-        except ValueError:
+        div_date = parse_date(td.text)
+        if div_date is None:
             self.log.error("分析除權息日期失敗:%s" % td.text)
             return None
 
         td = table.find_all('tr')[2].find_all('td')[2]
         for span in td.find_all('span', class_='mg'):
             span.decompose()
-        try:
-            payable_date = datetime.strptime(td.text, '%Y/%m/%d').date()
-        except ValueError:
+        payable_date = parse_date(td.text)
+        if payable_date is None:
             self.log.error("分析除權息日期失敗:%s" % td.text)
             return None
 
@@ -242,10 +455,11 @@ class DividendMoneylink(DividendWebsite):
             return self.parse_div_table_normal(table)
 
 
-    def get_dividend_info(self, stock_id: str) -> DividendInfo:
+    def fetch_dividend_info(self, stock_id: str) -> DividendInfo:
         try:
             soup = self.get_web_soup(self.query_url % stock_id)
-            div_data = self.parse_div_data(stock_id, soup)
+            with metrics.timer('extract.%s' % self.name):
+                div_data = self.parse_div_data(stock_id, soup)
         except Exception as err:
             self.log.error('Failed to parse moneylink page for %s:' % stock_id)
             self.log.error(err)
@@ -261,11 +475,53 @@ class DividendMoneydj(DividendWebsite):
     '''
     Use the overall table to get recent div data in one shot to avoid DOS detection
     '''
+    # Answered from memory once the table is loaded
+    hedge_delay = 1.0
+
     def __init__(self) -> None:
         super().__init__(name='moneydj')
         self.query_url = 'https://www.moneydj.com/Z/ZE/ZEB/ZEB.djhtm'
-        self.soup = self.get_web_soup(self.query_url)
-        self.soup_string = str(self.soup)
+
+    def get_listing_urls(self) -> List[str]:
+        return [self.query_url]
+
+    def is_valid_page(self, html: str) -> bool:
+        # every listed stock is linked by a GenLink2stk() script
+        return 'GenLink2stk' in html
+
+    def get_parse_only(self) -> SoupStrainer:
+        from html_parser import SoupStrainer
+        return SoupStrainer('tr')
+
+    def parse_listing(self, soup: BeautifulSoup) -> Dict[str, Tuple[str, List[DividendRecord]]]:
+        listing = {}
+        for script in soup.find_all('script'):
+            if not script.string:
+                continue
+
+            stock_id = self.get_stock_id(script)
+            if stock_id is None or stock_id in listing:
+                continue
+
+            found_tr = script.find_parent('tr')
+            if found_tr:
+                div_record = self.parse_div_info(found_tr)
+            else:           # Case: probably web paging paring error
+                self.log.error("Found script of %s, but cannot found parent <tr>" % stock_id)
+                div_record = []
+
+            listing[stock_id] = (self.get_stockname(script), div_record)
+
+        return listing
+
+    def get_stock_id(self, found_script) -> str:
+        # The script looks like GenLink2stk('AS2330','台積電'); strip the market
+        # prefix of the first argument to get the stock_id
+        text = found_script.string.strip().split("'")
+        if len(text) < 4:
+            return None
+        stock_id = text[1].lstrip(string.ascii_letters)
+        return stock_id or None
 
     def get_stockname(self, found_script) -> str:
         try:
@@ -282,12 +538,9 @@ class DividendMoneydj(DividendWebsite):
     def parse_div_info(self, found_tr) -> list[DividendRecord]:
         div_data = []
         td_list = found_tr.find_all('td')
-        try:
-            date_string = td_list[1].get_text(strip=True)
-            div_date = datetime.strptime(date_string, '%Y/%m/%d').date()
-        except ValueError:
+        div_date = parse_date(td_list[1].get_text(strip=True))
+        if div_date is None:
             self.log.error("分析除息日期失敗:%s" % td_list)
-            div_date = 0
 
         try:
             cash = float(td_list[4].get_text(strip=True))
@@ -295,12 +548,9 @@ class DividendMoneydj(DividendWebsite):
             self.log.error("分析現金股利失敗:%s" % td_list)
             cash = 0.0
 
-        try:
-            date_string = td_list[5].get_text(strip=True)
-            payable_date = datetime.strptime(date_string, '%Y/%m/%d').date()
-        except ValueError:
+        payable_date = parse_date(td_list[5].get_text(strip=True))
+        if payable_date is None:
             self.log.error("分析股利發放日期失敗:%s" % td_list)
-            payable_date = 0
 
         d = DividendRecord(div_date, payable_date, cash, 0.0)
         self.log.debug(d)
@@ -308,109 +558,332 @@ class DividendMoneydj(DividendWebsite):
 
         return div_data
 
-    def get_dividend_info(self, stock_id: str) -> DividendInfo:
-        found_script = None
-        found_tr = None
-        try:
-            all_scripts = self.soup.find_all('script')
-            for script in all_scripts:
-                found_content = script.string
-                if found_content and stock_id in found_content:
-                    found_script = script
-                    break
-            else:
-                self.log.debug('Not found record for %s' % stock_id)
+    def fetch_dividend_info(self, stock_id: str) -> DividendInfo:
+        # There is no page of a single stock. Case: Not found any, make an empty one to avoid error
+        self.log.debug('Not found record for %s' % stock_id)
+        info = DividendInfo(stock_id, 'NA')
+        div_data = DividendRecord(None, None, 0.0, 0.0)
+        info.div_record = [div_data]
+        return info
 
-            if found_script:
-                found_tr = found_script.find_parent('tr')
-                if not found_tr:
-                    self.log.error("Found script, but cannot found parent <tr>")
-        except Exception as err:
-            self.log.error('Failed to parse moneylink page for %s:' % stock_id)
-            self.log.error(err)
-            traceback.print_exc()
-            return None
+
+class DividendGetterRegistry(Mapping):
+    '''
+    name -> getter, where each getter is constructed the first time it is
+    used and then shared by everyone asking for the same name
+    '''
+    def __init__(self, factories: Dict[str, Callable[[], DividendWebsite]]):
+        self.factories = factories
+        self.instances: Dict[str, DividendWebsite] = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> DividendWebsite:
+        with self.lock:
+            getter = self.instances.get(name)
+            if getter is None:
+                getter = self.factories[name]()
+                self.instances[name] = getter
+            return getter
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self) -> int:
+        return len(self.factories)
+
+
+all_dividend_getters = DividendGetterRegistry({
+    'moneylink': DividendMoneylink,
+    'moneydj': DividendMoneydj,
+    'goodinfo': DividendGoodinfo,
+})
+
+
+def get_dividend_getters(names: List[str]) -> List[DividendWebsite]:
+    return [all_dividend_getters[name] for name in names]
+
+
+def run_in_getter_thread(func, *args) -> asyncio.Future:
+    # Not asyncio.to_thread: asyncio.run() would wait on exit for the
+    # getters a race has already given up on
+    return asyncio.get_running_loop().run_in_executor(getter_executor, func, *args)
+
+
+def call_getter(getter: DividendWebsite, stock_id: str) -> DividendInfo:
+    ''' getter.get_dividend_info() guarded by the circuit breaker of the getter '''
+    breaker = getter.circuit_breaker
+    if breaker is not None and not breaker.allow_request():
+        log.debug('Skip %s for %s, its circuit is open' % (getter.name, stock_id))
+        return None
+
+    getter.site_failure.failed = False
+    try:
+        with metrics.timer('lookup.%s' % getter.name):
+            info = getter.get_dividend_info(stock_id)
+    except Exception as err:
+        log.error('%s failed to get %s info: %s' % (getter.name, stock_id, err))
+        info = None
+    if info is not None and info.div_record is None:
+        log.error('%s found no dividend table of %s' % (getter.name, stock_id))
+        info = None
+
+    metrics.record_attempt(getter.name, info is not None)
+    if info is not None:
+        info.source = getter.name
+
+    # a stock the site has no data of says nothing about the site
+    if breaker is not None:
+        if getter.site_failed():
+            breaker.record_failure()
         else:
-            info = None
-            if found_script:    # Case: found one
-                stock_name = self.get_stockname(found_script)
-                info = DividendInfo(stock_id, stock_name=stock_name)
-                if found_tr:
-                    info.div_record = self.parse_div_info(found_tr)
-                else:           # Case: probably web paging paring error
-                    info.div_record = []
-            else:               # Case: Not found any, make an empty one to avoid error
-                info = DividendInfo(stock_id, 'NA')
-                div_data = DividendRecord(0, 0, 0, 0)
-                info.div_record = [div_data]
+            breaker.record_success()
+    return info
 
-            return info
 
+def trim_div_info(info: DividendInfo, max_nr_record: int) -> DividendInfo:
+    if len(info.div_record) > 0:
+        if info.div_record[0].cash > 0.0 and \
+           info.div_record[0].payable_date is None:  # probably ETF
+            # Probably not yet decide payble_date
+            log.warning("The latest record has cash=%.2f but payble_date is None." %
+                        info.div_record[0].cash)
+
+        if len(info.div_record) > max_nr_record:
+            info.div_record = info.div_record[0:max_nr_record]
 
-all_dividend_getters = {
-    'moneylink': DividendMoneylink(),
-    'moneydj': DividendMoneydj(),
-    'goodinfo': DividendGoodinfo(),
-}
+    return info
+
+
+def has_dated_record(info: DividendInfo) -> bool:
+    return any(r.div_date is not None or r.payable_date is not None for r in info.div_record)
 
 
 def get_dividend_info(stock_id: str,
                       dividend_getters=all_dividend_getters.values(),
-                      max_nr_record: int=default_max_nr_record) \
+                      max_nr_record: int=default_max_nr_record,
+                      strategy: str=default_strategy) \
                      -> DividendInfo:
+    if strategy != strategy_sequential:
+        return asyncio.run(async_get_dividend_info(stock_id, dividend_getters,
+                                                   max_nr_record, strategy))
+
     for getter in dividend_getters:
         log.debug('Using %s to get %s info' % (getter.name, stock_id))
-        info = getter.get_dividend_info(stock_id)
+        info = call_getter(getter, stock_id)
         if info is not None:
-            if len(info.div_record) > 0:
-                if info.div_record[0].cash > 0.0 and \
-                   info.div_record[0].payable_date is None:  # probably ETF
-                    # Probably not yet decide payble_date
-                    log.warning("The latest record has cash=%.2f but payble_date is None." %
-                                info.div_record[0].cash)
-
-                if len(info.div_record) > max_nr_record:
-                    info.div_record = info.div_record[0:max_nr_record]
-
-            return info
+            return trim_div_info(info, max_nr_record)
     else:
         log.error('Failed to get ex dividend data for %s:' % stock_id)
         return None
 
 
-def get_many_dividend_info(stocks: list,
-                           dividend_getters=all_dividend_getters.values(),
-                           max_nr_record: int=default_max_nr_record,
-                           sleep_interval: int=default_sleep_interval) -> Dict[str, DividendInfo]:
-    div_info = {}
-    for stock_id in stocks:
-        log.info('Obtaining %s...' % stock_id)
-        __div_info = get_dividend_info(stock_id, dividend_getters)
-
-        if __div_info is None:
-            __div_info = DividendInfo(stock_id=stock_id, stock_name="NA")
-            __div_info.error = '找不到 %s 的任何資料，可能網頁分析失敗' % stock_id
-            log.error(__div_info.error)
-        elif len(__div_info.div_record) == 0:
-            __div_info.error = '%s(%s) 最近沒有除權息資料，可能真的缺乏除權息資料' % \
-                                (__div_info.stock_name, __div_info.stock_name)
-            log.warning(__div_info.error)
-        else:
-            log.info('%s(%s) %s' % (__div_info.stock_id, __div_info.stock_name, __div_info.div_record[0]))
+async def async_get_dividend_info(stock_id: str,
+                                  dividend_getters=all_dividend_getters.values(),
+                                  max_nr_record: int=default_max_nr_record,
+                                  strategy: str=default_strategy) \
+                                 -> DividendInfo:
+    '''
+    sequential: try the getters one after another, like get_dividend_info
+    race:       query all getters at the same time, the first one that
+                returns a dated record wins and the others are cancelled
+    hedged:     start the next getter when the running one has not answered
+                within its hedge_delay, or as soon as it fails
+    An answer without any dated record is only returned when no getter
+    has a better one.
+    '''
+    if strategy == strategy_sequential:
+        return await run_in_getter_thread(get_dividend_info, stock_id,
+                                          dividend_getters, max_nr_record)
+    if strategy not in all_strategies:
+        raise ValueError('Unknown strategy %s' % strategy)
+
+    dividend_getters = list(dividend_getters)
+    running = {}
+    next_getter = 0
+    fallback = None
+
+    def start_next():
+        nonlocal next_getter
+        getter = dividend_getters[next_getter]
+        next_getter += 1
+        log.debug('Using %s to get %s info' % (getter.name, stock_id))
+        task = run_in_getter_thread(call_getter, getter, stock_id)
+        running[task] = getter
+        return getter
+
+    try:
+        if strategy == strategy_race:
+            while next_getter < len(dividend_getters):
+                start_next()
+        elif dividend_getters:
+            start_next()
+
+        while running:
+            timeout = None
+            if next_getter < len(dividend_getters):
+                timeout = dividend_getters[next_getter - 1].hedge_delay
+
+            done, _ = await asyncio.wait(running.keys(), timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                getter = running.pop(task)
+                try:
+                    info = task.result()
+                except Exception as err:
+                    log.error('%s failed to get %s info: %s' % (getter.name, stock_id, err))
+                    continue
+                if info is None:
+                    continue
+                if not has_dated_record(info):
+                    # e.g. moneydj's placeholder of a stock it does not list,
+                    # only used if no other getter knows the stock
+                    if fallback is None or dividend_getters.index(getter) < dividend_getters.index(fallback[0]):
+                        fallback = (getter, info)
+                    continue
+                log.debug('%s won the %s for %s' % (getter.name, strategy, stock_id))
+                return trim_div_info(info, max_nr_record)
+
+            # timed out or the running getter failed, hedge with the next one
+            if next_getter < len(dividend_getters):
+                getter = start_next()
+                if not done:
+                    log.debug('Hedge %s with %s' % (stock_id, getter.name))
+    finally:
+        for task in running:
+            task.cancel()
+
+    if fallback is not None:
+        return trim_div_info(fallback[1], max_nr_record)
+    log.error('Failed to get ex dividend data for %s:' % stock_id)
+    return None
+
+
+def timeout_div_info(stock_id: str, reason: str) -> DividendInfo:
+    div_info = DividendInfo(stock_id=stock_id, stock_name="NA")
+    div_info.error = '查詢 %s 逾時 (timeout)，%s' % (stock_id, reason)
+    metrics.incr('timeout')
+    return div_info
 
-        div_info[stock_id] = __div_info
 
-        log.debug("Sleep %d seconds to avoid DOS detecting.." % sleep_interval)
-        time.sleep(sleep_interval)
+def check_div_info(stock_id: str, div_info: DividendInfo) -> DividendInfo:
+    if div_info is None:
+        div_info = DividendInfo(stock_id=stock_id, stock_name="NA")
+        div_info.error = '找不到 %s 的任何資料，可能網頁分析失敗' % stock_id
+        log.error(div_info.error)
+    elif div_info.error is not None:
+        log.error(div_info.error)
+    elif len(div_info.div_record) == 0:
+        div_info.error = '%s(%s) 最近沒有除權息資料，可能真的缺乏除權息資料' % \
+                         (div_info.stock_name, div_info.stock_name)
+        log.warning(div_info.error)
+    else:
+        log.info('%s(%s) %s' % (div_info.stock_id, div_info.stock_name, div_info.div_record[0]))
 
+    div_info.fetched_at = datetime.now().replace(microsecond=0)
+    metrics.record_result(stock_id, div_info.source)
     return div_info
 
 
+async def async_get_many_dividend_info(stocks: list,
+                                       dividend_getters=all_dividend_getters.values(),
+                                       max_nr_record: int=default_max_nr_record,
+                                       sleep_interval: int=default_sleep_interval,
+                                       max_concurrency: int=default_max_concurrency,
+                                       strategy: str=default_strategy,
+                                       on_result: Callable[[str, DividendInfo], None] = None,
+                                       deadline: float = None,
+                                       stock_timeout: float = None,
+                                       start_delay: float = 0.0,
+                                       keep_results: bool = True) \
+                                      -> Dict[str, DividendInfo]:
+    '''
+    Look up stocks concurrently. Instead of sleeping after every stock, each
+    website host is throttled to one request per sleep_interval seconds at
+    the moment it is actually fetched, so lookups answered from memory
+    (e.g. moneydj) are never delayed.
+    on_result(stock_id, info) is called as soon as each stock is done.
+    Stocks are started in the given order. A stock not done within
+    stock_timeout seconds, or by deadline (a time.time() value), gets a
+    timeout error instead, so the batch always returns by the deadline.
+    No website is requested in the first start_delay seconds.
+    Without keep_results every result is only passed to on_result and an
+    empty dict is returned, so memory does not grow with the watch list.
+    '''
+    host_rate_limiter.configure(sleep_interval, start_delay=start_delay)
+    dividend_getters = list(dividend_getters)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    def get_timeout() -> float:
+        if deadline is None:
+            return stock_timeout
+        left = deadline - time.time()
+        return left if stock_timeout is None else min(stock_timeout, left)
+
+    # a handful of listing requests instead of one request per stock
+    listing_getters = [getter for getter in dividend_getters if getter.get_listing_urls()]
+    prefetching = asyncio.gather(*[run_in_getter_thread(getter.prefetch) for getter in listing_getters],
+                                 return_exceptions=True)
+    try:
+        prefetched = await asyncio.wait_for(prefetching, None if deadline is None else deadline - time.time())
+    except asyncio.TimeoutError:
+        log.warning('Prefetching listings did not finish before the deadline')
+        prefetched = []
+    for getter, err in zip(listing_getters, prefetched):
+        if isinstance(err, Exception):
+            log.warning('Failed to prefetch listing of %s: %s' % (getter.name, err))
+
+    async def __get_one(stock_id: str) -> DividendInfo:
+        async with semaphore:
+            timeout = get_timeout()
+            if timeout is not None and timeout <= 0:
+                __div_info = timeout_div_info(stock_id, '已超過整批查詢的期限')
+            else:
+                log.info('Obtaining %s...' % stock_id)
+                try:
+                    __div_info = await asyncio.wait_for(
+                        async_get_dividend_info(stock_id, dividend_getters, max_nr_record, strategy),
+                        timeout)
+                except asyncio.TimeoutError:
+                    __div_info = timeout_div_info(stock_id, '%.1f 秒內未完成' % timeout)
+        __div_info = check_div_info(stock_id, __div_info)
+        if on_result is not None:
+            on_result(stock_id, __div_info)
+        return __div_info if keep_results else None
+
+    results = await asyncio.gather(*[__get_one(stock_id) for stock_id in stocks])
+    return dict(zip(stocks, results)) if keep_results else {}
+
+
+def get_many_dividend_info(stocks: list,
+                           dividend_getters=all_dividend_getters.values(),
+                           max_nr_record: int=default_max_nr_record,
+                           sleep_interval: int=default_sleep_interval,
+                           max_concurrency: int=default_max_concurrency,
+                           strategy: str=default_strategy,
+                           on_result: Callable[[str, DividendInfo], None] = None,
+                           deadline: float = None,
+                           stock_timeout: float = None,
+                           start_delay: float = 0.0,
+                           keep_results: bool = True) \
+                          -> Dict[str, DividendInfo]:
+    return asyncio.run(async_get_many_dividend_info(stocks,
+                                                    dividend_getters,
+                                                    max_nr_record=max_nr_record,
+                                                    sleep_interval=sleep_interval,
+                                                    max_concurrency=max_concurrency,
+                                                    strategy=strategy,
+                                                    on_result=on_result,
+                                                    deadline=deadline,
+                                                    stock_timeout=stock_timeout,
+                                                    start_delay=start_delay,
+                                                    keep_results=keep_results))
+
+
 if __name__ == '__main__':
     log_format = '[%(levelname)7s] %(asctime)s %(name)s %(message)s'
     logging.basicConfig(level=logging.DEBUG, format=log_format)
 
-    prefer_getters = [DividendMoneydj()]
+    prefer_getters = get_dividend_getters(['moneydj'])
     # prefer_getters = all_dividend_getters.values()
 
     stocks = ['1784']
@@ -1,38 +1,49 @@
+from dataclasses import dataclass
 from datetime import datetime, date, timedelta
-from typing import Dict
+from typing import Dict, List
 
+
+def str_to_date(s: str) -> date:
+    # to_dict() writes 'None', older runs wrote '0' for the placeholder record of moneydj
+    if s in ('None', '0', '', None):
+        return None
+    return date.fromisoformat(s)
+
+@dataclass(frozen=True, slots=True)
 class DividendRecord:
-    def __init__(self):
-        self.div_date = None
-        self.payable_date = None
-        self.cash = 0.0
-        self.stock = 0.0
-
-    def __init__(self, div_date:datetime.date, payable_date:datetime.date,
-                 cash:float, stock:float):
-        self.div_date = div_date
-        self.payable_date = payable_date
-        self.cash = cash
-        self.stock = stock
+    div_date: date = None
+    payable_date: date = None
+    cash: float = 0.0
+    stock: float = 0.0
 
     def __str__(self) -> str:
         return 'div_date:%s payable_date:%s cash:%.2f stock:%.2f' % \
                (str(self.div_date), str(self.payable_date),
                 self.cash, self.stock)
 
+    def to_dict(self) -> Dict[str, str]:
+        return {'div_date': str(self.div_date),
+                'payable_date': str(self.payable_date),
+                'cash': '%.4f' % self.cash,
+                'stock': '%.4f' % self.stock}
+
+    @classmethod
+    def from_dict(cls, r: dict) -> 'DividendRecord':
+        return cls(str_to_date(r['div_date']), str_to_date(r['payable_date']),
+                   float(r['cash']), float(r['stock']))
+
 
 class DividendInfo:
-    def __init__(self):
-        self.stock_id = 0
-        self.stock_name = ''
-        self.div_record = []
-        self.error = None
+    __slots__ = ('stock_id', 'stock_name', 'div_record', 'error', 'fetched_at', 'source')
 
-    def __init__(self, stock_id: str, stock_name: str):
+    def __init__(self, stock_id: str = '', stock_name: str = ''):
         self.stock_id = stock_id
         self.stock_name = stock_name
-        self.div_record = []
+        self.div_record: List[DividendRecord] = []
         self.error = None
+        self.fetched_at = None
+        # name of the getter that found this info
+        self.source = None
 
     def filter_future_event(self):
         future_div_record = []
@@ -60,14 +71,16 @@ class DividendInfo:
         d['stock_id'] = self.stock_id
         d['stock_name'] = self.stock_name
         d['error'] = 'None' if self.error is None else self.error
-        d['div_record'] = []
-
-        for r in self.div_record:
-            record = {}
-            record['div_date'] = str(r.div_date)
-            record['payable_date'] = str(r.payable_date)
-            record['cash'] = "%.4f" % r.cash
-            record['stock'] = "%.4f" % r.stock
-            d['div_record'].append(record)
-
+        d['fetched_at'] = 'None' if self.fetched_at is None else self.fetched_at.isoformat(timespec='seconds')
+        d['div_record'] = [r.to_dict() for r in self.div_record]
         return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'DividendInfo':
+        ''' The reverse of to_dict(), e.g. to load the output of a previous run '''
+        info = cls(d['stock_id'], d['stock_name'])
+        info.error = None if d.get('error', 'None') == 'None' else d['error']
+        fetched_at = d.get('fetched_at', 'None')
+        info.fetched_at = None if fetched_at == 'None' else datetime.fromisoformat(fetched_at)
+        info.div_record = [DividendRecord.from_dict(r) for r in d['div_record']]
+        return info
@@ -0,0 +1,158 @@
+from datetime import date, datetime
+from dividend_info import DividendInfo, DividendRecord
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_db_file = '~/.local/share/stock-robot/dividend.sqlite3'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS dividend_info (
+    stock_id     TEXT PRIMARY KEY,
+    stock_name   TEXT,
+    error        TEXT,
+    updated_at   TEXT NOT NULL
+);
+-- the primary key also serves lookups by stock_id
+CREATE TABLE IF NOT EXISTS dividend_record (
+    stock_id     TEXT NOT NULL,
+    div_date     TEXT NOT NULL,
+    payable_date TEXT,
+    cash         REAL NOT NULL,
+    stock        REAL NOT NULL,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (stock_id, div_date)
+);
+CREATE INDEX IF NOT EXISTS dividend_record_div_date ON dividend_record (div_date);
+CREATE INDEX IF NOT EXISTS dividend_record_payable_date ON dividend_record (payable_date);
+'''
+
+
+def date_to_text(d: date) -> str:
+    return None if d is None else d.isoformat()
+
+
+def text_to_date(s: str) -> date:
+    return date.fromisoformat(s) if s else None
+
+
+class DividendStore:
+    '''
+    SQLite history of every DividendInfo and DividendRecord seen. Records
+    are keyed by (stock_id, div_date), so storing the same run twice or a
+    later run with updated amounts replaces the older row.
+    '''
+    def __init__(self, path: str = default_db_file):
+        self.path = os.path.expanduser(path)
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(schema)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upsert(self, infos: Iterable[DividendInfo], updated_at: datetime = None):
+        '''
+        Rows are stamped with updated_at, by default with the fetched_at of
+        each info, so a result reused by --incremental keeps its age
+        '''
+        now = datetime.now()
+        info_rows = []
+        record_rows = []
+        for info in infos:
+            stamp = (updated_at or info.fetched_at or now).isoformat(timespec='seconds')
+            info_rows.append((info.stock_id, info.stock_name, info.error, stamp))
+            for r in info.div_record:
+                div_date = date_to_text(r.div_date)
+                if div_date is None:    # not a scheduled event, nothing to index
+                    continue
+                record_rows.append((info.stock_id, div_date, date_to_text(r.payable_date),
+                                    r.cash, r.stock, stamp))
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO dividend_info (stock_id, stock_name, error, updated_at) '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (stock_id) DO UPDATE SET '
+                'stock_name = excluded.stock_name, error = excluded.error, '
+                'updated_at = excluded.updated_at',
+                info_rows)
+            self.conn.executemany(
+                'INSERT INTO dividend_record '
+                '(stock_id, div_date, payable_date, cash, stock, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (stock_id, div_date) DO UPDATE SET '
+                'payable_date = COALESCE(excluded.payable_date, payable_date), '
+                'cash = excluded.cash, stock = excluded.stock, '
+                'updated_at = excluded.updated_at',
+                record_rows)
+        log.debug('Stored %d stocks and %d records to %s' %
+                  (len(info_rows), len(record_rows), self.path))
+
+    def upsert_many(self, div_info: Dict[str, DividendInfo], updated_at: datetime = None):
+        self.upsert(div_info.values(), updated_at)
+
+    def get_upcoming(self, start: date, end: date, by_payable_date: bool = False) \
+            -> List[Tuple[str, str, DividendRecord]]:
+        '''
+        (stock_id, stock_name, record) of every record whose div_date (or
+        payable_date) is within [start, end], ordered by that date
+        '''
+        column = 'payable_date' if by_payable_date else 'div_date'
+        rows = self.conn.execute(
+            'SELECT r.stock_id, i.stock_name, r.div_date, r.payable_date, r.cash, r.stock '
+            'FROM dividend_record r LEFT JOIN dividend_info i ON i.stock_id = r.stock_id '
+            'WHERE r.{0} BETWEEN ? AND ? ORDER BY r.{0}, r.stock_id'.format(column),
+            (start.isoformat(), end.isoformat()))
+        return [(stock_id, stock_name,
+                 DividendRecord(text_to_date(div_date), text_to_date(payable_date), cash, stock))
+                for stock_id, stock_name, div_date, payable_date, cash, stock in rows]
+
+    def get_history(self, stock_id: str) -> DividendInfo:
+        ''' All stored records of stock_id, the latest first like the websites '''
+        row = self.conn.execute(
+            'SELECT stock_name, error, updated_at FROM dividend_info WHERE stock_id = ?',
+            (stock_id,)).fetchone()
+        if row is None:
+            return None
+
+        info = DividendInfo(stock_id, row[0])
+        info.error = row[1]
+        info.fetched_at = datetime.fromisoformat(row[2])
+        rows = self.conn.execute(
+            'SELECT div_date, payable_date, cash, stock FROM dividend_record '
+            'WHERE stock_id = ? ORDER BY div_date DESC', (stock_id,))
+        info.div_record = [DividendRecord(text_to_date(div_date), text_to_date(payable_date), cash, stock)
+                           for div_date, payable_date, cash, stock in rows]
+        return info
+
+
+if __name__ == '__main__':
+    import argparse
+    from datetime import timedelta
+
+    parser = argparse.ArgumentParser(description='Query the dividend history database.')
+    parser.add_argument('--db', default=default_db_file,
+                        help='Database file, default value is %(default)s')
+    parser.add_argument('-d', '--days', type=int, default=7,
+                        help='Show ex-dividend dates within the next N days, default value is %(default)s')
+    parser.add_argument('-s', '--stock', help='Show the whole history of a stock instead')
+    args = parser.parse_args()
+
+    with DividendStore(args.db) as store:
+        if args.stock:
+            print(repr(store.get_history(args.stock)))
+        else:
+            today = date.today()
+            for stock_id, stock_name, record in store.get_upcoming(today, today + timedelta(days=args.days)):
+                print('%s(%s) %s' % (stock_id, stock_name, record))
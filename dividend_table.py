@@ -0,0 +1,197 @@
+from array import array
+from datetime import date, datetime, timedelta
+from dividend_info import DividendInfo, DividendRecord, str_to_date
+import math
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# date columns hold ordinals, 0 for None
+none_ordinal = 0
+
+
+def date_to_ordinal(d: date) -> int:
+    return none_ordinal if d is None else d.toordinal()
+
+
+def ordinal_to_date(n: int) -> date:
+    return None if n == none_ordinal else date.fromordinal(n)
+
+
+def text_to_ordinal(s: str) -> int:
+    # the reverse of str() of a record date in to_dict()
+    return date_to_ordinal(str_to_date(s))
+
+
+class DividendTable:
+    '''
+    Many DividendInfo in columns: per stock lists of id, name, error and
+    source, and flat arrays of record dates (ordinals) and amounts shared
+    by all stocks. The records of row i are [offset[i], offset[i + 1]) of
+    the record columns. Converts to and from the to_dict() shape of the
+    output file without loss.
+    '''
+    def __init__(self):
+        self.stock_id: List[str] = []
+        self.stock_name: List[str] = []
+        self.error: List[str] = []
+        self.source: List[str] = []
+        # timestamp in seconds, nan for None
+        self.fetched_at = array('d')
+        self.offset = array('l', [0])
+        self.div_date = array('l')
+        self.payable_date = array('l')
+        self.cash = array('d')
+        self.stock = array('d')
+        self.row: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.stock_id)
+
+    def __contains__(self, stock_id: str) -> bool:
+        return stock_id in self.row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.stock_id)
+
+    @property
+    def nr_record(self) -> int:
+        return len(self.cash)
+
+    def _append_row(self, stock_id: str, stock_name: str, error: str, source: str, fetched_at: float):
+        self.row[stock_id] = len(self.stock_id)
+        self.stock_id.append(stock_id)
+        self.stock_name.append(stock_name)
+        self.error.append(error)
+        self.source.append(source)
+        self.fetched_at.append(fetched_at)
+        self.offset.append(len(self.cash))
+
+    def append(self, info: DividendInfo):
+        if info.stock_id in self.row:
+            raise KeyError('%s is already in the table' % info.stock_id)
+        for r in info.div_record:
+            self.div_date.append(date_to_ordinal(r.div_date))
+            self.payable_date.append(date_to_ordinal(r.payable_date))
+            self.cash.append(r.cash)
+            self.stock.append(r.stock)
+        self._append_row(info.stock_id, info.stock_name, info.error, info.source,
+                         info.fetched_at.timestamp() if info.fetched_at else math.nan)
+
+    def extend(self, infos: Iterable[DividendInfo]):
+        for info in infos:
+            self.append(info)
+
+    @classmethod
+    def from_infos(cls, infos: Iterable[DividendInfo]) -> 'DividendTable':
+        table = cls()
+        table.extend(infos)
+        return table
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, dict]) -> 'DividendTable':
+        ''' From the output file, without building DividendInfo on the way '''
+        table = cls()
+        for stock_id, info in d.items():
+            for r in info['div_record']:
+                table.div_date.append(text_to_ordinal(r['div_date']))
+                table.payable_date.append(text_to_ordinal(r['payable_date']))
+                table.cash.append(float(r['cash']))
+                table.stock.append(float(r['stock']))
+            error = info.get('error', 'None')
+            fetched_at = info.get('fetched_at', 'None')
+            table._append_row(stock_id, info['stock_name'],
+                              None if error == 'None' else error, None,
+                              math.nan if fetched_at == 'None' else datetime.fromisoformat(fetched_at).timestamp())
+        return table
+
+    def records(self, i: int) -> List[DividendRecord]:
+        start, end = self.offset[i], self.offset[i + 1]
+        return [DividendRecord(ordinal_to_date(div_date), ordinal_to_date(payable_date), cash, stock)
+                for div_date, payable_date, cash, stock in
+                zip(self.div_date[start:end], self.payable_date[start:end],
+                    self.cash[start:end], self.stock[start:end])]
+
+    def get_info(self, i: int) -> DividendInfo:
+        info = DividendInfo(self.stock_id[i], self.stock_name[i])
+        info.error = self.error[i]
+        info.source = self.source[i]
+        fetched_at = self.fetched_at[i]
+        info.fetched_at = None if math.isnan(fetched_at) else datetime.fromtimestamp(fetched_at)
+        info.div_record = self.records(i)
+        return info
+
+    def get(self, stock_id: str) -> DividendInfo:
+        i = self.row.get(stock_id)
+        return None if i is None else self.get_info(i)
+
+    def to_infos(self) -> Dict[str, DividendInfo]:
+        return {stock_id: self.get_info(i) for i, stock_id in enumerate(self.stock_id)}
+
+    def to_dict(self) -> Dict[str, dict]:
+        ''' The same dict as to_dict() of every DividendInfo, keyed by stock id '''
+        div_date = [str(ordinal_to_date(n)) for n in self.div_date]
+        payable_date = [str(ordinal_to_date(n)) for n in self.payable_date]
+        cash = ['%.4f' % n for n in self.cash]
+        stock = ['%.4f' % n for n in self.stock]
+
+        result = {}
+        for i, stock_id in enumerate(self.stock_id):
+            fetched_at = self.fetched_at[i]
+            result[stock_id] = {
+                'stock_id': stock_id,
+                'stock_name': self.stock_name[i],
+                'error': 'None' if self.error[i] is None else self.error[i],
+                'fetched_at': 'None' if math.isnan(fetched_at) else
+                              datetime.fromtimestamp(fetched_at).isoformat(timespec='seconds'),
+                'div_record': [{'div_date': div_date[j], 'payable_date': payable_date[j],
+                                'cash': cash[j], 'stock': stock[j]}
+                               for j in range(self.offset[i], self.offset[i + 1])],
+            }
+        return result
+
+    def record_rows(self) -> array:
+        ''' Row index of every record '''
+        rows = array('l')
+        for i in range(len(self.stock_id)):
+            rows.extend([i] * (self.offset[i + 1] - self.offset[i]))
+        return rows
+
+    def filter(self, stock_ids: Iterable[str]) -> 'DividendTable':
+        ''' A new table of the given stocks, in that order, skipping unknown ones '''
+        table = DividendTable()
+        for stock_id in stock_ids:
+            i = self.row.get(stock_id)
+            if i is None or stock_id in table.row:
+                continue
+            start, end = self.offset[i], self.offset[i + 1]
+            table.div_date.extend(self.div_date[start:end])
+            table.payable_date.extend(self.payable_date[start:end])
+            table.cash.extend(self.cash[start:end])
+            table.stock.extend(self.stock[start:end])
+            table._append_row(stock_id, self.stock_name[i], self.error[i], self.source[i],
+                              self.fetched_at[i])
+        return table
+
+    def upcoming(self, days: int, today: date = None, by_payable_date: bool = False) \
+            -> List[Tuple[str, str, DividendRecord]]:
+        '''
+        (stock_id, stock_name, record) of every record whose div_date (or
+        payable_date) is within [today, today + days], ordered by that date.
+        One pass over the ordinal column, no DividendInfo is built.
+        '''
+        today = today or date.today()
+        start = today.toordinal()
+        end = (today + timedelta(days=days)).toordinal()
+        dates = self.payable_date if by_payable_date else self.div_date
+        hits = sorted((n, j) for j, n in enumerate(dates) if start <= n <= end)
+        if not hits:
+            return []
+
+        rows = self.record_rows()
+        result = []
+        for n, j in hits:
+            i = rows[j]
+            result.append((self.stock_id[i], self.stock_name[i],
+                           DividendRecord(ordinal_to_date(self.div_date[j]),
+                                          ordinal_to_date(self.payable_date[j]),
+                                          self.cash[j], self.stock[j])))
+        return result
@@ -5,7 +5,19 @@ import io
 import json
 from datetime import datetime, date, timedelta
 from dividend_info import DividendInfo, DividendRecord
+import batch_workers
+import change_detector
 import dividend_getter
+from dividend_store import DividendStore
+from dividend_table import DividendTable
+from circuit_breaker import CircuitBreakerStore, default_cooldown, default_state_file
+from http_cache import HttpCache, default_cache_dir
+import http_transport
+import incremental
+import scheduler
+from metrics import metrics
+from ndjson_output import NdjsonWriter
+import contextlib
 import logging
 import time
 import os
@@ -13,11 +25,12 @@ import traceback
 
 
 default_sleep_interval = dividend_getter.default_sleep_interval
+default_max_concurrency = dividend_getter.default_max_concurrency
 default_watch_list_file = '~/.local/share/stock-robot/ex_dividend_watch_list.txt'
 log = logging.getLogger(os.path.basename(__file__))
 
-# TODO: parameterize this
-prefer_getters = [dividend_getter.DividendMoneydj()]
+default_prefer_getters = ['moneydj']
+default_request_timeout = http_transport.default_timeout
 
 def read_watch_list_file(stock_list_file):
     # watch_list_path = os.path.expanduser(default_watch_list_file)
@@ -35,31 +48,140 @@ def write_to_file(outfile: io.TextIOWrapper, div_info: dict[str, DividendInfo]):
     json.dump(result, outfile, indent=2, ensure_ascii=False)
 
 
+def get_list_output_path(output_dir: str, stock_list_file) -> str:
+    name = os.path.splitext(os.path.basename(stock_list_file.name))[0]
+    return os.path.join(output_dir, name + '.json')
+
+
+def write_list_outputs(output_dir: str, watch_lists: dict, div_info: dict[str, DividendInfo]):
+    ''' One output file per watch list, all sharing the result of one batch '''
+    os.makedirs(output_dir, exist_ok=True)
+    for stock_list_file, watch_list in watch_lists.items():
+        with open(get_list_output_path(output_dir, stock_list_file), 'w', encoding='utf8') as outfile:
+            write_to_file(outfile, {stock_id: div_info[stock_id] for stock_id in watch_list})
+
+
+def get_sidecar_path(args, name: str) -> str:
+    ''' <output>.<name> next to the output, None without an output file '''
+    if args.output is not None and not args.output.name.startswith('<'):
+        return os.path.splitext(args.output.name)[0] + '.' + name
+    if args.ndjson_output is not None:
+        return os.path.splitext(args.ndjson_output)[0] + '.' + name
+    if args.output_dir is not None:
+        return os.path.join(args.output_dir, name)
+    return None
+
+
 def get_arguments():
     parser = argparse.ArgumentParser(description='Ex-dividend notifier.')
 
     stock_arg = parser.add_mutually_exclusive_group(required=True)
     stock_arg.add_argument('-s', '--stocks', nargs='+',
                            help='Specify watching stock id. If not specified read the watch list file')
-    stock_arg.add_argument('-l', '--stock-list-file',
+    stock_arg.add_argument('-l', '--stock-list-file', nargs='+',
                            type=argparse.FileType('r'),
-                           help='Specify watch list file of interesting stock list')
+                           help='Specify watch list file of interesting stock list. With several '
+                                'files, a stock in more than one list is fetched once and each list '
+                                'is written to its own file in --output-dir')
 
     parser.add_argument('-a', '--all-record', action="store_true", default=False,
                         help='Store all record, do not filter out past record')
     parser.add_argument('-o', '--output', type=argparse.FileType('w', encoding='utf8'),
                         help='Specify output file, if None output to stdout')
+    parser.add_argument('--output-dir',
+                        help='With several watch list files, write <list name>.json of each list here')
+    parser.add_argument('--ndjson-output',
+                        help='Also write one JSON line per stock to this file as soon as the stock '
+                             'is done, in the order they finish. See ndjson_output.py to compact it '
+                             'into the --output format')
+    parser.add_argument('--ndjson-only', action="store_true", default=False,
+                        help='Only write --ndjson-output and keep no result in memory, for watch '
+                             'lists too large to hold. Cannot be used with --output, --output-dir, '
+                             '--db or --changes')
     parser.add_argument('-v', '--verbosity', action="count", default=0,
                         help='increase output verbosity')
     parser.add_argument('-i', '--sleep-interval', type=int, default=default_sleep_interval,
                         help='Sleep interval in seconds, default value is %(default)s (seconds)')
+    parser.add_argument('-c', '--concurrency', type=int, default=default_max_concurrency,
+                        help='Number of stocks looked up at the same time, default value is %(default)s')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Split the watch list over N processes sharing the request rate, '
+                             'default value is %(default)s')
+    parser.add_argument('-g', '--getters', nargs='+', default=default_prefer_getters,
+                        choices=list(dividend_getter.all_dividend_getters),
+                        help='Websites to get dividend data from, in order of preference, '
+                             'default value is %(default)s')
+    parser.add_argument('--strategy', default=dividend_getter.default_strategy,
+                        choices=dividend_getter.all_strategies,
+                        help='How to combine the getters: try one after another, race all of them '
+                             'or hedge a slow one with the next, default value is %(default)s')
+    parser.add_argument('--db',
+                        help='Also store the result to this SQLite dividend history database')
+    parser.add_argument('--incremental', action="store_true", default=False,
+                        help='Only fetch stocks whose previous result may have changed, the previous '
+                             'result is read from --previous or else from --db')
+    parser.add_argument('--previous', type=argparse.FileType('r', encoding='utf8'),
+                        help='Output file of a previous run, used by --incremental and to look up '
+                             'stocks with events coming soon first. Without it --db is used')
+    parser.add_argument('--event-window', type=int, default=incremental.default_event_window,
+                        help='With --incremental, fetch stocks having an event within N days, '
+                             'default value is %(default)s')
+    parser.add_argument('--max-age', type=int, default=incremental.default_max_age,
+                        help='With --incremental, fetch stocks fetched more than N days ago, '
+                             'default value is %(default)s')
+    parser.add_argument('--deadline', type=float,
+                        help='Seconds the whole run may take, stocks not done by then get a timeout error')
+    parser.add_argument('--stock-timeout', type=float,
+                        help='Seconds the lookup of one stock may take over all websites')
+    parser.add_argument('--request-timeout', type=float, default=default_request_timeout,
+                        help='Seconds one web request or browser page may take, '
+                             'default value is %(default)s')
+    parser.add_argument('--circuit-state', default=default_state_file,
+                        help='File keeping which websites are skipped after failing, '
+                             'default value is %(default)s')
+    parser.add_argument('--circuit-cooldown', type=int, default=default_cooldown,
+                        help='Seconds to skip a failing website, default value is %(default)s')
+    parser.add_argument('--metrics',
+                        help='Write the run metrics here, default is next to the output file '
+                             'as <output>.metrics.json')
+    parser.add_argument('--changes',
+                        help='Write new, changed and cancelled events since the last run here, '
+                             'default is next to the output file as <output>.changes.json')
+    parser.add_argument('--fingerprint-state', default=change_detector.default_state_file,
+                        help='File keeping the fingerprint of every stock between runs, '
+                             'default value is %(default)s')
+    parser.add_argument('--profile',
+                        help='Dump cProfile stats of the run to this file')
+    parser.add_argument('--cache-dir', default=default_cache_dir,
+                        help='Directory of cached web pages, default value is %(default)s')
+    parser.add_argument('--no-cache', action="store_true", default=False,
+                        help='Always fetch web pages from network, and parse listings instead of '
+                             'reading their snapshot')
 
-    return parser.parse_args()
+    args = parser.parse_args()
 
+    if args.ndjson_only:
+        if args.ndjson_output is None:
+            parser.error('--ndjson-only needs --ndjson-output')
+        if args.output is not None or args.output_dir is not None or args.db is not None \
+                or args.changes is not None:
+            parser.error('--ndjson-only keeps no result for --output, --output-dir, --db or --changes')
+    elif args.stock_list_file is not None and len(args.stock_list_file) > 1:
+        if args.output is not None:
+            parser.error('use --output-dir instead of --output with several watch list files')
+        if args.output_dir is None:
+            parser.error('--output-dir is needed with several watch list files')
+        paths = [get_list_output_path(args.output_dir, f) for f in args.stock_list_file]
+        if len(set(paths)) < len(paths):
+            parser.error('watch list files must have different names, their outputs are named after them')
+    elif args.output_dir is not None:
+        parser.error('--output-dir is only used with several watch list files')
+
+    return args
 
-def main():
-    args = get_arguments()
 
+def run(args):
+    deadline = None if args.deadline is None else time.time() + args.deadline
     log_format = '[%(levelname)7s] %(asctime)s %(name)s %(message)s'
     if args.verbosity >= 2:
         logging.basicConfig(level=logging.DEBUG, format=log_format)
@@ -68,22 +190,126 @@ def main():
     else:
         logging.basicConfig(level=logging.ERROR, format=log_format)
 
+    if args.no_cache:
+        dividend_getter.DividendWebsite.cache = None
+        dividend_getter.DividendWebsite.listing_snapshot_dir = None
+    else:
+        dividend_getter.DividendWebsite.cache = HttpCache(args.cache_dir)
+
+    dividend_getter.DividendWebsite.circuit_breakers = \
+        CircuitBreakerStore(args.circuit_state, cooldown=args.circuit_cooldown)
+    dividend_getter.set_request_timeout(args.request_timeout)
+
+    watch_lists = {}
     if args.stocks is None:
-        stocks = read_watch_list_file(args.stock_list_file)
+        watch_lists = {f: read_watch_list_file(f) for f in args.stock_list_file}
+        # popular stocks on many lists are fetched once
+        stocks = list(dict.fromkeys(stock_id for watch_list in watch_lists.values() for stock_id in watch_list))
+        log.info('%d stocks in %d watch lists' % (len(stocks), len(watch_lists)))
     else:
         stocks = args.stocks
 
     log.info('Today is %s' % date.today())
-    div_info = dividend_getter.get_many_dividend_info(stocks,
-                                                      prefer_getters,
-                                                      max_nr_record=1,
-                                                      sleep_interval=args.sleep_interval)
+    previous = DividendTable()
+    if args.previous is not None:
+        previous = incremental.load_previous_file(args.previous, stocks)
+    elif args.db is not None:
+        with DividendStore(args.db) as store:
+            previous = incremental.load_previous_store(store, stocks, max_nr_record=1)
+
+    stale_stocks = stocks
+    cached_info = {}
+    if args.incremental:
+        if args.previous is None and args.db is None:
+            log.error('--incremental needs --previous or --db, fetch all stocks')
+        stale_stocks, cached_info = incremental.split_stale(stocks, previous,
+                                                            event_window=args.event_window,
+                                                            max_age=args.max_age)
+    # stocks with events coming soon are done first in case the deadline cuts the run short
+    stale_stocks = scheduler.order_by_priority(stale_stocks, previous)
 
-    if args.output is None:
+    writer = NdjsonWriter(args.ndjson_output) if args.ndjson_output is not None else None
+    on_result = writer.write if writer is not None else None
+    with writer or contextlib.nullcontext():
+        if on_result is not None:
+            for stock_id, info in cached_info.items():
+                on_result(stock_id, info)
+
+        if args.workers > 1:
+            div_info = batch_workers.get_many_dividend_info(stale_stocks,
+                                                            args.getters,
+                                                            args.workers,
+                                                            max_nr_record=1,
+                                                            sleep_interval=args.sleep_interval,
+                                                            max_concurrency=args.concurrency,
+                                                            strategy=args.strategy,
+                                                            on_result=on_result,
+                                                            deadline=deadline,
+                                                            stock_timeout=args.stock_timeout,
+                                                            request_timeout=args.request_timeout,
+                                                            cache_dir=None if args.no_cache else args.cache_dir,
+                                                            circuit_state=args.circuit_state,
+                                                            circuit_cooldown=args.circuit_cooldown,
+                                                            keep_results=not args.ndjson_only)
+        else:
+            prefer_getters = dividend_getter.get_dividend_getters(args.getters)
+            div_info = dividend_getter.get_many_dividend_info(stale_stocks,
+                                                              prefer_getters,
+                                                              max_nr_record=1,
+                                                              sleep_interval=args.sleep_interval,
+                                                              max_concurrency=args.concurrency,
+                                                              strategy=args.strategy,
+                                                              on_result=on_result,
+                                                              deadline=deadline,
+                                                              stock_timeout=args.stock_timeout,
+                                                              keep_results=not args.ndjson_only)
+    dividend_getter.DividendWebsite.circuit_breakers.save()
+
+    if args.ndjson_only:
+        metrics_file = args.metrics or get_sidecar_path(args, 'metrics.json')
+        if metrics_file is not None:
+            metrics.write(metrics_file)
+        return
+
+    div_info = incremental.merge(stocks, div_info, cached_info)
+
+    if args.db is not None:
+        with DividendStore(args.db) as store:
+            store.upsert_many(div_info)
+
+    if args.output_dir is not None:
+        write_list_outputs(args.output_dir, watch_lists, div_info)
+    elif args.output is None:
         print('None of output file')
     else:
         write_to_file(args.output, div_info)
 
+    changes_file = args.changes or get_sidecar_path(args, 'changes.json')
+    if changes_file is not None:
+        detector = change_detector.ChangeDetector(args.fingerprint_state)
+        change_detector.write_changes(changes_file, detector.detect(div_info))
+        detector.save()
+
+    metrics_file = args.metrics or get_sidecar_path(args, 'metrics.json')
+    if metrics_file is not None:
+        metrics.write(metrics_file)
+
+
+def main():
+    args = get_arguments()
+    if args.profile is None:
+        run(args)
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        run(args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
 
 if __name__ == '__main__':
     main()
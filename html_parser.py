@@ -0,0 +1,38 @@
+import logging
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+log = logging.getLogger(os.path.basename(__file__))
+
+try:
+    import lxml  # noqa: F401
+    default_features = 'lxml'
+except ImportError:
+    default_features = 'html.parser'
+
+
+class AnySoupStrainer(SoupStrainer):
+    '''
+    Keep a tag (and everything inside it) if any of the given strainers
+    would keep it, e.g. a table found by id plus another one found by class.
+    '''
+    def __init__(self, *strainers: SoupStrainer):
+        super().__init__()
+        self.strainers = strainers
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return any(s.allow_tag_creation(nsprefix, name, attrs) for s in self.strainers)
+
+    def allow_string_creation(self, string) -> bool:
+        return False
+
+
+def make_soup(markup, parse_only: SoupStrainer = None,
+              features: str = None) -> BeautifulSoup:
+    '''
+    Parse markup with lxml when it is installed, otherwise html.parser.
+    With parse_only only the matching subtrees are built, which is much
+    faster and smaller than the whole page.
+    '''
+    return BeautifulSoup(markup, features or default_features, parse_only=parse_only)
@@ -0,0 +1,149 @@
+from atomic_file import write_atomic
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_cache_dir = '~/.cache/stock-robot/http'
+default_max_bytes = 256 * 1024 * 1024
+# evict down to this part of max_bytes, so a full cache is not walked on every put
+evict_ratio = 0.9
+# Dividend schedules change at most once a day
+default_cache_ttl = 12 * 60 * 60
+
+
+def get_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class CacheEntry:
+    def __init__(self, url: str, body: str, fetched_at: float,
+                 etag: str = None, last_modified: str = None):
+        self.url = url
+        self.body = body
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def validators(self) -> dict:
+        ''' Headers for a conditional request '''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    '''
+    On-disk page cache keyed by the sha256 of the URL. Each entry is a body
+    file plus a small json file of metadata. The mtime of the body file is
+    bumped on every hit, and the least recently used entries are removed
+    once the cache grows over max_bytes. The size of the bodies is counted
+    once and then kept up to date by put(), the cache directory is only
+    walked again to evict. Other processes sharing the directory are seen
+    at that walk.
+    '''
+    def __init__(self, cache_dir: str = default_cache_dir, max_bytes: int = default_max_bytes):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # bytes of all bodies, None until counted
+        self.total_bytes: Optional[int] = None
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        path = self._path(url)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(path + '.body', encoding='utf-8') as f:
+                body = f.read()
+            os.utime(path + '.body')
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('url') != url:
+            return None
+        return CacheEntry(url, body, meta['fetched_at'],
+                          meta.get('etag'), meta.get('last_modified'))
+
+    def put(self, url: str, body: str, etag: str = None, last_modified: str = None):
+        path = self._path(url)
+        meta = {
+            'url': url,
+            'fetched_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        old_size = get_size(path + '.body')
+        try:
+            write_atomic(path + '.body', body)
+            write_atomic(path + '.json', json.dumps(meta))
+        except OSError as err:
+            log.warning('Failed to cache %s: %s' % (url, err))
+            return
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(body[1] for body in self._list_bodies())
+            else:
+                self.total_bytes += get_size(path + '.body') - old_size
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def refresh(self, entry: CacheEntry):
+        ''' The server answered 304 Not Modified, restart the ttl of entry '''
+        self.put(entry.url, entry.body, entry.etag, entry.last_modified)
+
+    def _list_bodies(self) -> list:
+        ''' (mtime, size, path) of every body file '''
+        bodies = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.body'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                bodies.append((st.st_mtime, st.st_size, path))
+        return bodies
+
+    def evict(self):
+        with self.lock:
+            bodies = self._list_bodies()
+            total = sum(body[1] for body in bodies)
+            self.total_bytes = total
+            if total <= self.max_bytes:
+                return
+
+            bodies.sort()
+            for mtime, size, path in bodies:
+                if total <= self.max_bytes * evict_ratio:
+                    break
+                log.debug('Evict %s from cache' % path)
+                for suffix in ('.body', '.json'):
+                    try:
+                        os.remove(path[:-len('.body')] + suffix)
+                    except OSError:
+                        pass
+                total -= size
+            self.total_bytes = total
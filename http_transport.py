@@ -0,0 +1,236 @@
+import email.utils
+import http.client
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urljoin, urlsplit
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_timeout = 30
+default_max_retry = 3
+default_backoff_base = 1.0
+default_backoff_max = 30.0
+default_max_idle_per_host = 4
+max_redirect = 5
+# Do not let a server park us for longer than this
+max_retry_after = 120
+chunk_size = 64 * 1024
+
+retry_status = {429, 500, 502, 503, 504}
+redirect_status = {301, 302, 303, 307, 308}
+# A reused keep-alive connection may have been closed by the server meanwhile
+stale_connection_errors = (http.client.RemoteDisconnected, ConnectionResetError,
+                           BrokenPipeError, http.client.CannotSendRequest)
+
+
+class Response:
+    def __init__(self, url: str, status: int, headers: http.client.HTTPMessage,
+                 body: bytes, elapsed: float, attempts: int, wire_bytes: int):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # seconds spent sending and receiving over all attempts, without
+        # before_request() and the backoff sleeps
+        self.elapsed = elapsed
+        self.attempts = attempts
+        # bytes received over all attempts, before decompression
+        self.wire_bytes = wire_bytes
+
+    def text(self) -> str:
+        encoding = self.headers.get_content_charset() or 'utf-8'
+        return self.body.decode(encoding, 'ignore')
+
+    def __str__(self) -> str:
+        return '%d %s (%d bytes, %.3fs, %d attempts)' % \
+               (self.status, self.url, len(self.body), self.elapsed, self.attempts)
+
+
+class RetryableError(Exception):
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str) -> float:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def read_body(response: http.client.HTTPResponse) -> Tuple[bytes, int]:
+    ''' Read the whole body, decoding gzip/deflate chunk by chunk, and the number of bytes read '''
+    coding = (response.getheader('Content-Encoding') or '').strip().lower()
+    if coding == 'gzip':
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif coding == 'deflate':
+        decoder = zlib.decompressobj()
+    else:
+        decoder = None
+
+    chunks = []
+    nr_byte = 0
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        nr_byte += len(chunk)
+        if decoder is not None:
+            try:
+                chunk = decoder.decompress(chunk)
+            except zlib.error:
+                if coding != 'deflate' or chunks:
+                    raise
+                # some servers send raw deflate without the zlib header
+                decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                chunk = decoder.decompress(chunk)
+        chunks.append(chunk)
+    if decoder is not None:
+        chunks.append(decoder.flush())
+    return b''.join(chunks), nr_byte
+
+
+class HttpTransport:
+    '''
+    Shared HTTP client that keeps idle keep-alive connections per host and
+    retries network errors, 429 and 5xx with exponential backoff and jitter.
+    A Retry-After header from the server takes precedence over the backoff.
+    '''
+    def __init__(self, timeout: float = default_timeout,
+                 max_retry: int = default_max_retry,
+                 backoff_base: float = default_backoff_base,
+                 backoff_max: float = default_backoff_max,
+                 max_idle_per_host: int = default_max_idle_per_host):
+        self.timeout = timeout
+        self.max_retry = max_retry
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_idle_per_host = max_idle_per_host
+        self.lock = threading.Lock()
+        self.idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+
+    def _get_connection(self, scheme: str, netloc: str) -> Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            idle = self.idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return conn, False
+
+    def _put_connection(self, scheme: str, netloc: str, conn: http.client.HTTPConnection):
+        with self.lock:
+            idle = self.idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, url: str, headers: dict, timeout: float) \
+            -> Tuple[int, http.client.HTTPMessage, bytes, int]:
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn, reused = self._get_connection(parts.scheme, parts.netloc)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            except stale_connection_errors:
+                if not reused:
+                    raise
+                conn.close()
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+            body, nr_byte = read_body(response)
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put_connection(parts.scheme, parts.netloc, conn)
+        return response.status, response.headers, body, nr_byte
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def request(self, url: str, headers: dict = None,
+                before_request: Callable[[str], None] = None,
+                timeout: float = None) -> Response:
+        '''
+        GET url, following redirects. before_request(url) is called before
+        every attempt, e.g. to take a rate limiter token. Returns the last
+        response; raises the last error if no response was ever received.
+        '''
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        headers.setdefault('Connection', 'keep-alive')
+        timeout = self.timeout if timeout is None else timeout
+        elapsed = 0.0
+        wire_bytes = 0
+
+        attempt = 0
+        nr_redirect = 0
+        while True:
+            attempt += 1
+            try:
+                if before_request is not None:
+                    before_request(url)
+                start = time.monotonic()
+                try:
+                    status, resp_headers, body, nr_byte = self._send(url, headers, timeout)
+                finally:
+                    elapsed += time.monotonic() - start
+                wire_bytes += nr_byte
+                if status in redirect_status and nr_redirect < max_redirect:
+                    location = resp_headers.get('Location')
+                    if location:
+                        nr_redirect += 1
+                        url = urljoin(url, location)
+                        attempt -= 1
+                        continue
+                if status in retry_status:
+                    raise RetryableError('HTTP %d from %s' % (status, url),
+                                         parse_retry_after(resp_headers.get('Retry-After')))
+                return Response(url, status, resp_headers, body, elapsed, attempt, wire_bytes)
+            except (RetryableError, OSError, http.client.HTTPException) as err:
+                if attempt > self.max_retry:
+                    if isinstance(err, RetryableError):
+                        return Response(url, status, resp_headers, body, elapsed, attempt, wire_bytes)
+                    raise
+                retry_after = getattr(err, 'retry_after', None)
+                delay = self.backoff(attempt - 1) if retry_after is None else min(retry_after, max_retry_after)
+                log.warning('%s, retry (%d) after %.1f seconds..' % (err, attempt, delay))
+                time.sleep(delay)
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+            self.idle.clear()
+
+
+default_transport = HttpTransport()
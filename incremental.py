@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from dividend_info import DividendInfo
+from dividend_store import DividendStore
+from dividend_table import DividendTable
+import io
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+
+log = logging.getLogger(os.path.basename(__file__))
+
+# in days
+default_event_window = 7
+default_max_age = 7
+
+
+def load_previous_file(infile: io.TextIOWrapper, stocks: List[str]) -> DividendTable:
+    '''
+    Load the stocks of the json written by get_ex_dividend_info.write_to_file().
+    Kept in columns, a file of --all-record can hold the whole history.
+    '''
+    return DividendTable.from_dict(json.load(infile)).filter(stocks)
+
+
+def load_previous_store(store: DividendStore, stocks: List[str],
+                        max_nr_record: int) -> DividendTable:
+    previous = DividendTable()
+    for stock_id in stocks:
+        info = store.get_history(stock_id)
+        if info is not None:
+            info.div_record = info.div_record[0:max_nr_record]
+            previous.append(info)
+    return previous
+
+
+def get_stale_reason(info: DividendInfo, now: datetime,
+                     event_window: int = default_event_window,
+                     max_age: int = default_max_age) -> str:
+    ''' Why info has to be fetched again, None if the previous result still holds '''
+    if info is None:
+        return 'not fetched before'
+    if info.error is not None:
+        return 'failed last time'
+    if info.fetched_at is None or now - info.fetched_at > timedelta(days=max_age):
+        return 'older than %d days' % max_age
+
+    today = now.date()
+    window_start = today - timedelta(days=event_window)
+    window_end = today + timedelta(days=event_window)
+    for r in info.div_record:
+        if r.div_date is None and r.payable_date is None:   # no scheduled event
+            continue
+        if r.div_date is None or r.payable_date is None:
+            return 'missing dates'
+        if window_start <= r.div_date <= window_end or \
+           window_start <= r.payable_date <= window_end:
+            return 'event within %d days' % event_window
+    return None
+
+
+def split_stale(stocks: List[str], previous: DividendTable,
+                event_window: int = default_event_window,
+                max_age: int = default_max_age) -> Tuple[List[str], Dict[str, DividendInfo]]:
+    ''' Return (stocks to fetch again, previous results to keep) '''
+    now = datetime.now()
+    stale = []
+    cached = {}
+    for stock_id in stocks:
+        info = previous.get(stock_id)
+        reason = get_stale_reason(info, now, event_window, max_age)
+        if reason is None:
+            cached[stock_id] = info
+        else:
+            log.debug('Refresh %s: %s' % (stock_id, reason))
+            stale.append(stock_id)
+
+    log.info('%d of %d stocks need to be fetched again' % (len(stale), len(stocks)))
+    return stale, cached
+
+
+def merge(stocks: List[str], fresh: Dict[str, DividendInfo],
+          cached: Dict[str, DividendInfo]) -> Dict[str, DividendInfo]:
+    ''' Fresh and cached results in the order of the watch list '''
+    return {stock_id: fresh[stock_id] if stock_id in fresh else cached[stock_id]
+            for stock_id in stocks}
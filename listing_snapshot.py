@@ -0,0 +1,117 @@
+'''
+Binary snapshot of a parsed listing (stock_id -> (stock_name, div_record)),
+written once per refresh and memory-mapped read-only by every process, so
+a lookup needs neither the web page nor parsing it.
+
+Layout, little endian:
+
+    header      magic, created_at (time.time()), nr_stock, nr_record, text size
+    text        utf-8 of the stock ids then the stock names, '\\0' separated
+    offsets     nr_stock + 1 uint32, records of stock i are [offset i, offset i + 1)
+    records     nr_record times div_date ordinal, payable_date ordinal, cash, stock
+'''
+from array import array
+from atomic_file import write_atomic
+from collections.abc import Mapping
+from datetime import date
+from dividend_info import DividendRecord
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Tuple
+
+log = logging.getLogger(os.path.basename(__file__))
+
+default_snapshot_dir = '~/.cache/stock-robot/listing'
+
+magic = b'DIVSNAP1'
+header_format = struct.Struct('<8sdIII')
+record_format = struct.Struct('<iidd')
+# date ordinal of None
+none_ordinal = 0
+
+
+def get_snapshot_path(snapshot_dir: str, name: str) -> str:
+    return os.path.join(os.path.expanduser(snapshot_dir), name + '.snap')
+
+
+def write_snapshot(path: str, listing: Dict[str, Tuple[str, List[DividendRecord]]]):
+    ''' Replace the snapshot at path, processes mapping the old one keep reading it '''
+    stock_ids = list(listing)
+    text = '\0'.join(stock_ids + [listing[stock_id][0] for stock_id in stock_ids]).encode('utf-8')
+    offsets = array('I', [0])
+    records = bytearray()
+    for stock_id in stock_ids:
+        for r in listing[stock_id][1]:
+            records += record_format.pack(none_ordinal if r.div_date is None else r.div_date.toordinal(),
+                                          none_ordinal if r.payable_date is None else r.payable_date.toordinal(),
+                                          r.cash, r.stock)
+        offsets.append(len(records) // record_format.size)
+    if offsets.itemsize != 4:
+        raise RuntimeError('array(\'I\') is not 32 bits on this platform')
+
+    write_atomic(path, b''.join([header_format.pack(magic, time.time(), len(stock_ids), offsets[-1], len(text)),
+                                 text, offsets.tobytes(), bytes(records)]))
+    log.debug('Wrote snapshot of %d stocks to %s' % (len(stock_ids), path))
+
+
+class ListingSnapshot(Mapping):
+    ''' A read-only listing backed by a mapped snapshot file, records are decoded on lookup '''
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        found_magic, self.created_at, nr_stock, nr_record, text_size = header_format.unpack_from(self.map, 0)
+        if found_magic != magic:
+            raise ValueError('%s is not a listing snapshot' % path)
+
+        start = header_format.size
+        words = self.map[start:start + text_size].decode('utf-8').split('\0') if nr_stock else []
+        self.names = words[nr_stock:]
+        self.rows = {stock_id: i for i, stock_id in enumerate(words[:nr_stock])}
+        start += text_size
+        self.offsets = array('I')
+        self.offsets.frombytes(self.map[start:start + 4 * (nr_stock + 1)])
+        self.records_start = start + 4 * (nr_stock + 1)
+        if self.records_start + nr_record * record_format.size > len(self.map):
+            raise ValueError('%s is truncated' % path)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def __getitem__(self, stock_id: str) -> Tuple[str, List[DividendRecord]]:
+        i = self.rows[stock_id]
+        records = []
+        for n in range(self.offsets[i], self.offsets[i + 1]):
+            div_date, payable_date, cash, stock = \
+                record_format.unpack_from(self.map, self.records_start + n * record_format.size)
+            records.append(DividendRecord(None if div_date == none_ordinal else date.fromordinal(div_date),
+                                          None if payable_date == none_ordinal else date.fromordinal(payable_date),
+                                          cash, stock))
+        return self.names[i], records
+
+    def __contains__(self, stock_id) -> bool:
+        return stock_id in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def open_snapshot(path: str, max_age: float) -> ListingSnapshot:
+    ''' The snapshot at path, None if there is none or it is older than max_age seconds '''
+    try:
+        snapshot = ListingSnapshot(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as err:
+        log.warning('Ignore broken snapshot %s: %s' % (path, err))
+        return None
+    if snapshot.age > max_age:
+        log.debug('Snapshot %s is %.0f seconds old, refresh it' % (path, snapshot.age))
+        return None
+    return snapshot
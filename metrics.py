@@ -0,0 +1,163 @@
+import bisect
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict
+
+log = logging.getLogger(os.path.basename(__file__))
+
+# Upper bounds of the histogram buckets, in milliseconds
+default_buckets_ms = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    def __init__(self, buckets_ms=default_buckets_ms):
+        self.buckets_ms = buckets_ms
+        # the last bucket counts everything above the largest bound
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    def merge(self, other: 'Histogram'):
+        if other.buckets_ms != self.buckets_ms:
+            raise ValueError('Cannot merge histograms of different buckets')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        buckets = {'<=%g' % bound: n for bound, n in zip(self.buckets_ms, self.counts)}
+        buckets['>%g' % self.buckets_ms[-1]] = self.counts[-1]
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else None,
+            'min_ms': None if self.min is None else round(self.min, 3),
+            'max_ms': None if self.max is None else round(self.max, 3),
+            'buckets': buckets,
+        }
+
+
+class Metrics:
+    '''
+    Process-wide counters and timing histograms of one run. Names are
+    '<what>.<source>', e.g. fetch.moneylink, parse.moneydj, throttle.goodinfo.tw
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now()
+            self.start = time.monotonic()
+            self.timings: Dict[str, Histogram] = {}
+            self.counters: Dict[str, int] = {}
+            self.attempts: Dict[str, Dict[str, int]] = {}
+            self.stock_source: Dict[str, str] = {}
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def incr(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_attempt(self, source: str, success: bool):
+        with self.lock:
+            attempts = self.attempts.setdefault(source, {'success': 0, 'failure': 0})
+            attempts['success' if success else 'failure'] += 1
+
+    def record_result(self, stock_id: str, source: str):
+        ''' source is the getter that answered for stock_id, None if none did '''
+        with self.lock:
+            self.stock_source[stock_id] = source
+
+    def __getstate__(self) -> dict:
+        # sent back from worker processes, a lock does not pickle
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def merge(self, other: 'Metrics'):
+        ''' Add the counters, timings and attempts of other, e.g. of a worker process '''
+        with self.lock:
+            for name, histogram in other.timings.items():
+                if name in self.timings:
+                    self.timings[name].merge(histogram)
+                else:
+                    self.timings[name] = copy.deepcopy(histogram)
+            for name, n in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for source, attempts in other.attempts.items():
+                mine = self.attempts.setdefault(source, {'success': 0, 'failure': 0})
+                for key, n in attempts.items():
+                    mine[key] += n
+            self.stock_source.update(other.stock_source)
+
+    def summary(self) -> dict:
+        with self.lock:
+            sources = {}
+            for source, attempts in self.attempts.items():
+                total = attempts['success'] + attempts['failure']
+                sources[source] = dict(attempts,
+                                       success_rate=round(attempts['success'] / total, 4) if total else None,
+                                       served=0)
+            for source in self.stock_source.values():
+                if source is not None:
+                    sources.setdefault(source, {'success': 0, 'failure': 0,
+                                                'success_rate': None, 'served': 0})
+                    sources[source]['served'] += 1
+
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'elapsed_sec': round(time.monotonic() - self.start, 3),
+                'nr_stock': len(self.stock_source),
+                'nr_failed_stock': sum(1 for s in self.stock_source.values() if s is None),
+                'sources': sources,
+                'counters': dict(sorted(self.counters.items())),
+                'timings': {name: h.to_dict() for name, h in sorted(self.timings.items())},
+                'stock_source': dict(self.stock_source),
+            }
+
+    def write(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        log.debug('Metrics written to %s' % path)
+
+
+metrics = Metrics()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+'''
+Streaming output: one to_dict() per line, written as soon as the stock is
+done, so a crash keeps everything finished so far and readers can start
+before the run ends. Lines go to <path>.part, which is renamed to <path>
+when the run completes.
+
+Lines are in the order the stocks finish. Compact an NDJSON output into
+the legacy JSON output file, in the order of the watch list files when
+given:
+
+    ndjson_output.py result.ndjson result.json -l watch_list.txt
+'''
+import argparse
+from dividend_info import DividendInfo
+import json
+import logging
+import os
+import threading
+from typing import Dict, List
+
+log = logging.getLogger(os.path.basename(__file__))
+
+partial_suffix = '.part'
+
+
+class NdjsonWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.partial_path = path + partial_suffix
+        self.lock = threading.Lock()
+        self.nr_line = 0
+        self.file = open(self.partial_path, 'w', encoding='utf-8')
+
+    def write(self, stock_id: str, info: DividendInfo):
+        line = json.dumps(info.to_dict(), ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.nr_line += 1
+
+    def close(self):
+        ''' Make the complete output visible at path '''
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self.partial_path, self.path)
+        log.debug('%d lines written to %s' % (self.nr_line, self.path))
+
+    def abort(self):
+        ''' Keep the lines written so far in <path>.part '''
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        log.error('Run did not finish, %d lines kept in %s' % (self.nr_line, self.partial_path))
+
+    def __enter__(self) -> 'NdjsonWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_ndjson(f) -> Dict[str, dict]:
+    '''
+    {stock_id: to_dict()} of an NDJSON output, the last line wins. A
+    truncated last line of an unfinished run is skipped.
+    '''
+    result = {}
+    for nr, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            d = json.loads(line)
+        except ValueError:
+            log.warning('Skip broken line %d of %s' % (nr, getattr(f, 'name', 'input')))
+            continue
+        result[d['stock_id']] = d
+    return result
+
+
+def compact(ndjson_file, json_file, stocks: List[str] = None):
+    '''
+    Write an NDJSON output in the format of write_to_file(), in the order
+    of stocks if given. Stocks missing from the output are left out.
+    '''
+    result = read_ndjson(ndjson_file)
+    if stocks is not None:
+        missing = [stock_id for stock_id in stocks if stock_id not in result]
+        if missing:
+            log.warning('%d stocks not in the output: %s' % (len(missing), ' '.join(missing)))
+        result = {stock_id: result[stock_id] for stock_id in dict.fromkeys(stocks) if stock_id in result}
+    json.dump(result, json_file, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact NDJSON output into the legacy JSON output.')
+    parser.add_argument('input', type=argparse.FileType('r', encoding='utf8'),
+                        help='NDJSON output, or its .part file of an unfinished run')
+    parser.add_argument('output', type=argparse.FileType('w', encoding='utf8'),
+                        help='JSON output file, - for stdout')
+    parser.add_argument('-l', '--stock-list-file', nargs='+',
+                        type=argparse.FileType('r'),
+                        help='Watch list files of the run, to write the stocks in their order '
+                             'instead of the order they finished')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stocks = None
+    if args.stock_list_file is not None:
+        stocks = [stock_id for f in args.stock_list_file for stock_id in f.read().splitlines() if stock_id]
+    compact(args.input, args.output, stocks)
+
+
+if __name__ == '__main__':
+    main()
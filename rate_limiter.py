@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+log = logging.getLogger(os.path.basename(__file__))
+
+# Same meaning as dividend_getter.default_sleep_interval: at most one request
+# per host every N seconds
+default_min_interval = 2
+default_burst = 1
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket. Tokens may go negative, which reserves a slot in
+    the future so concurrent callers are spaced out instead of all waking up
+    at the same time. A delay starts the bucket that many seconds in debt.
+    '''
+    def __init__(self, rate: float, burst: int = default_burst, delay: float = 0.0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst - max(delay, 0.0) * rate
+        self.last = time.monotonic()
+
+    def reserve(self) -> float:
+        ''' Take one token and return how long the caller has to wait for it '''
+        if self.rate <= 0:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class HostRateLimiter:
+    '''
+    One token bucket per host, created on first use. No host is requested
+    before start_delay seconds after configure(), which lets processes
+    sharing a host take turns instead of starting together.
+    '''
+    def __init__(self, min_interval: float = default_min_interval, burst: int = default_burst):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.configure(min_interval, burst)
+
+    def configure(self, min_interval: float, burst: int = default_burst, start_delay: float = 0.0):
+        with self.lock:
+            self.rate = 1.0 / min_interval if min_interval > 0 else 0.0
+            self.burst = burst
+            self.start = time.monotonic() + start_delay
+            self.buckets.clear()
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst, self.start - time.monotonic())
+                self.buckets[host] = bucket
+            return bucket
+
+    def acquire(self, host: str) -> float:
+        waited = self.get_bucket(host).acquire()
+        if waited > 0:
+            log.debug('Waited %.2f seconds for %s to avoid DOS detecting..' % (waited, host))
+        return waited
+
+
+host_rate_limiter = HostRateLimiter()
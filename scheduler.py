@@ -0,0 +1,41 @@
+from datetime import date
+from dividend_info import DividendInfo
+from dividend_table import DividendTable
+import logging
+import os
+from typing import List, Tuple
+
+log = logging.getLogger(os.path.basename(__file__))
+
+# Order of the groups a stock is scheduled in
+priority_upcoming = 0       # has an ex-dividend or payable date ahead
+priority_unknown = 1        # not fetched before, or failed last time
+priority_quiet = 2          # fetched, nothing scheduled
+
+
+def get_priority(info: DividendInfo, today: date) -> Tuple[int, int]:
+    ''' (group, days to the nearest event), smaller goes first '''
+    if info is None or info.error is not None:
+        return (priority_unknown, 0)
+
+    days = None
+    for r in info.div_record:
+        for d in (r.div_date, r.payable_date):
+            if d is not None and d >= today:
+                days = (d - today).days if days is None else min(days, (d - today).days)
+    if days is None:
+        return (priority_quiet, 0)
+    return (priority_upcoming, days)
+
+
+def order_by_priority(stocks: List[str], previous: DividendTable,
+                      today: date = None) -> List[str]:
+    '''
+    Stocks whose previous result has an event coming soon first, nearest
+    first, then stocks without a usable previous result, then the rest.
+    The watch list order is kept within a group.
+    '''
+    today = today or date.today()
+    ordered = sorted(stocks, key=lambda stock_id: get_priority(previous.get(stock_id), today))
+    log.debug('Scheduled order: %s' % ordered)
+    return ordered